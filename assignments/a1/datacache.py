@@ -0,0 +1,258 @@
+"""Assignment 1 - Parsed data cache
+
+=== Module Description ===
+
+This file contains the functions that save the stations and rides parsed
+from a data file to a compact binary cache file, and load them back, so that
+the same file does not have to be parsed again each time a simulation is
+created from it.
+
+The cache for a data file is kept in the directory CACHE_DIR, next to the
+data file. It records the data file's size, modification time and SHA-256
+hash, as they were just before the file was parsed, so that a file changed
+while it is being parsed is not mistaken for the one that was parsed. The
+cache is used only while the data file still has the same size and hash.
+The hash is recomputed only when the modification time has changed, so
+checking the cache is normally very cheap.
+
+If a cache cannot be written (for example, because the directory is
+read-only), the data is simply parsed each time.
+
+The ride records in a cache can also be memory-mapped read-only with
+map_rides, so that every process using the same rides file shares one copy
+of them in memory, and none has to read them all in before starting.
+
+=== File Format ===
+
+All integers and floats are little-endian.
+  - the 8 bytes STATIONS_MAGIC or RIDES_MAGIC
+  - the data file's size and modification time in nanoseconds (2 x int64),
+    and its SHA-256 hash (32 bytes)
+  - the number of strings and of records (2 x int64)
+  - each string, as its length (uint16) followed by its UTF-8 bytes
+  - padding to a multiple of 8 bytes
+  - the records, as an array of STATION_RECORD or RIDE_RECORD
+
+For stations, the strings are each station's id followed by its name. For
+rides, the strings are the ids of the stations that rides start or end at,
+and each record refers to these by their position.
+"""
+import hashlib
+import os
+import struct
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+
+
+# Name of the directory, next to each data file, that holds its cache
+CACHE_DIR = '.bikeshare_cache'
+
+# A data file's size, modification time in nanoseconds and SHA-256 hash
+Stamp = Tuple[int, int, bytes]
+
+STATIONS_MAGIC = b'BIKESTN1'
+RIDES_MAGIC = b'BIKERID1'
+_HEADER = struct.Struct('<qq32sqq')
+_LENGTH = struct.Struct('<H')
+
+# The record stored for each station, and for each ride
+STATION_RECORD = np.dtype([('long', '<f8'), ('lat', '<f8'),
+                           ('num_bikes', '<i8'), ('capacity', '<i8')])
+RIDE_RECORD = np.dtype([('start_station', '<i4'), ('end_station', '<i4'),
+                        ('start_minute', '<i8'), ('end_minute', '<i8')])
+
+
+def load_stations(stations_file: str) -> \
+        Optional[Tuple[List[str], List[str], np.ndarray]]:
+    """Return the ids, names and STATION_RECORDs of the stations cached for
+    <stations_file>, or None if there is no up-to-date cache for it.
+    """
+    cached = _load(stations_file, STATIONS_MAGIC, STATION_RECORD)
+    if cached is None:
+        return None
+    strings, records = cached
+    return strings[:len(records)], strings[len(records):], records
+
+
+def save_stations(stations_file: str, source: Stamp, ids: List[str],
+                  names: List[str], records: np.ndarray) -> None:
+    """Cache the stations parsed from <stations_file>, given by their <ids>,
+    <names> and STATION_RECORDs. <source> is the file's stamp from just
+    before it was parsed.
+
+    Precondition: len(ids) == len(names) == len(records)
+    """
+    _save(stations_file, source, STATIONS_MAGIC, ids + names,
+          records.astype(STATION_RECORD))
+
+
+def load_rides(rides_file: str) -> Optional[Tuple[List[str], np.ndarray]]:
+    """Return the station ids and RIDE_RECORDs of the rides cached for
+    <rides_file>, or None if there is no up-to-date cache for it.
+    """
+    return _load(rides_file, RIDES_MAGIC, RIDE_RECORD)
+
+
+def save_rides(rides_file: str, source: Stamp, station_ids: List[str],
+               records: np.ndarray) -> None:
+    """Cache the rides parsed from <rides_file>, given by their RIDE_RECORDs,
+    whose stations are the positions of their ids in <station_ids>.
+    <source> is the file's stamp from just before it was parsed.
+    """
+    _save(rides_file, source, RIDES_MAGIC, station_ids,
+          records.astype(RIDE_RECORD))
+
+
+def map_rides(rides_file: str) -> Optional[Tuple[List[str], np.ndarray]]:
+    """Return the station ids of the rides cached for <rides_file>, and a
+    read-only, memory-mapped array of their RIDE_RECORDs, or None if there
+    is no up-to-date cache for it.
+
+    The array stays valid even if the cache is later replaced.
+    """
+    path = cache_path(rides_file)
+    try:
+        with open(path, 'rb') as file:
+            header = _read_header(file, rides_file, RIDES_MAGIC)
+            if header is None:
+                return None
+            strings, num_records = header
+            offset = file.tell()
+            if os.fstat(file.fileno()).st_size < \
+                    offset + num_records * RIDE_RECORD.itemsize:
+                return None
+        if num_records == 0:
+            return strings, np.zeros(0, dtype=RIDE_RECORD)
+        return strings, np.memmap(path, dtype=RIDE_RECORD, mode='r',
+                                  offset=offset, shape=(num_records,))
+    except (OSError, struct.error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def stamp(data_file: str) -> Stamp:
+    """Return the current size, modification time and hash of <data_file>,
+    to be passed to save_stations or save_rides once it has been parsed.
+    """
+    source = os.stat(data_file)
+    return source.st_size, source.st_mtime_ns, _hash(data_file)
+
+
+def cache_path(data_file: str) -> str:
+    """Return the path of the cache file for <data_file>.
+    """
+    directory, name = os.path.split(os.path.abspath(data_file))
+    return os.path.join(directory, CACHE_DIR, name + '.bin')
+
+
+def _load(data_file: str, magic: bytes,
+          dtype: np.dtype) -> Optional[Tuple[List[str], np.ndarray]]:
+    """Return the strings and records cached for <data_file>, if its cache
+    exists, starts with <magic> and is up to date.
+    """
+    path = cache_path(data_file)
+    try:
+        with open(path, 'rb') as file:
+            header = _read_header(file, data_file, magic)
+            if header is None:
+                return None
+            strings, num_records = header
+            records = np.fromfile(file, dtype, num_records)
+    except (OSError, struct.error, UnicodeDecodeError, ValueError):
+        return None
+
+    if len(records) != num_records:
+        return None
+    return strings, records
+
+
+def _read_header(file: BinaryIO, data_file: str,
+                 magic: bytes) -> Optional[Tuple[List[str], int]]:
+    """Read the start of the cache <file> for <data_file>, up to the
+    records, and return its strings and number of records.
+
+    Return None if the cache does not start with <magic> or is not up to
+    date.
+    """
+    if file.read(len(magic)) != magic:
+        return None
+    size, mtime, digest, num_strings, num_records = _HEADER.unpack(
+        file.read(_HEADER.size))
+
+    source = os.stat(data_file)
+    if source.st_size != size:
+        return None
+    if source.st_mtime_ns != mtime:
+        if _hash(data_file) != digest:
+            return None
+        # Unchanged, just touched: skip hashing it next time
+        _update_mtime(file.name, magic, source.st_mtime_ns)
+
+    strings = []
+    for _ in range(num_strings):
+        length, = _LENGTH.unpack(file.read(_LENGTH.size))
+        strings.append(file.read(length).decode('utf-8'))
+    file.seek(-file.tell() % 8, os.SEEK_CUR)
+    return strings, num_records
+
+
+def _save(data_file: str, source: Stamp, magic: bytes, strings: List[str],
+          records: np.ndarray) -> None:
+    """Write the cache for <data_file>, holding <strings> and <records>,
+    and recording <source> as the stamp of the data they were parsed from.
+
+    The cache is written to a temporary file which then replaces any old
+    cache, so that a cache is never read part way through being written.
+    """
+    path = cache_path(data_file)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as file:
+            file.write(magic)
+            file.write(_HEADER.pack(*source, len(strings), len(records)))
+            for string in strings:
+                encoded = string.encode('utf-8')
+                file.write(_LENGTH.pack(len(encoded)))
+                file.write(encoded)
+            file.write(bytes(-file.tell() % 8))
+            records.tofile(file)
+        os.replace(temp_path, path)
+    except OSError:
+        # The cache is only an optimisation, so carry on without it
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _update_mtime(path: str, magic: bytes, mtime: int) -> None:
+    """Record <mtime> as the data file's modification time in the cache
+    file <path>, if it can be written to.
+    """
+    try:
+        with open(path, 'r+b') as file:
+            file.seek(len(magic) + 8)
+            file.write(struct.pack('<q', mtime))
+    except OSError:
+        pass
+
+
+def _hash(data_file: str) -> bytes:
+    """Return the SHA-256 hash of the contents of <data_file>.
+    """
+    digest = hashlib.sha256()
+    with open(data_file, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['map_rides', 'stamp', '_load', '_save',
+                       '_update_mtime', '_hash'],
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'hashlib', 'os', 'struct', 'numpy'
+        ]
+    })
@@ -0,0 +1,100 @@
+"""Assignment 1 - Profiling the bike-share simulation
+
+=== Module description ===
+This file contains code to perform timing experiments on the parts of the
+bike-share simulation that dominate its running time on large data sets.
+
+Each experiment generates its own data in a temporary directory, so it can
+be run without the full Bixi ride history.
+"""
+from datetime import datetime, timedelta
+import os
+import random
+import tempfile
+import tracemalloc
+
+from timer import Timer
+from simulation import DATETIME_FORMAT, RideEndEvent, RideStartEvent, \
+    Simulation, create_stations, create_rides, parse_datetime
+
+
+NUM_RIDES = 1000000
+STATIONS_FILE = 'stations.json'
+
+
+def write_rides(rides_file: str, n: int) -> None:
+    """Write <n> random rides in the format of sample_rides.csv, in
+    non-decreasing order of start time, to <rides_file>.
+    """
+    station_ids = list(create_stations(STATIONS_FILE))
+    start = datetime(2017, 6, 1, 0, 0)
+    with open(rides_file, 'w') as file:
+        for i in range(n):
+            # Spread the rides evenly over a month
+            start_time = start + timedelta(minutes=i * 44640 // n)
+            end_time = start_time + timedelta(minutes=random.randint(1, 60))
+            file.write('{},{},{},{},{},1\n'.format(
+                start_time.strftime(DATETIME_FORMAT),
+                random.choice(station_ids),
+                end_time.strftime(DATETIME_FORMAT),
+                random.choice(station_ids),
+                (end_time - start_time).seconds))
+
+
+def profile_parse_datetime(rides_file: str) -> None:
+    """Compare strptime with parse_datetime on every timestamp in
+    <rides_file>, and time loading the whole file with create_rides.
+    """
+    with open(rides_file) as file:
+        timestamps = []
+        for line in file:
+            fields = line.split(',')
+            timestamps.append(fields[0])
+            timestamps.append(fields[2])
+
+    with Timer('strptime      ', is_verbose=False) as slow:
+        for text in timestamps:
+            datetime.strptime(text, DATETIME_FORMAT)
+    with Timer('parse_datetime', is_verbose=False) as fast:
+        for text in timestamps:
+            parse_datetime(text)
+
+    print(f'{len(timestamps)} timestamps:')
+    print(f'  {slow.label} {slow.interval:.3f} seconds')
+    print(f'  {fast.label} {fast.interval:.3f} seconds '
+          f'({slow.interval / fast.interval:.1f}x faster)')
+
+    stations = create_stations(STATIONS_FILE)
+    with Timer(f'create_rides on {rides_file}'):
+        create_rides(rides_file, stations)
+
+
+def profile_memory(rides_file: str) -> None:
+    """Report the memory used per ride, and per event, when the rides in
+    <rides_file> are loaded.
+    """
+    stations = create_stations(STATIONS_FILE)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rides = create_rides(rides_file, stations)
+    after_rides = tracemalloc.get_traced_memory()[0]
+    # Simulation is only needed as the owner of each event
+    sim = Simulation.__new__(Simulation)
+    events = [RideStartEvent(sim, ride) for ride in rides]
+    events.extend(RideEndEvent(sim, ride) for ride in rides)
+    after_events = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f'{len(rides)} rides:')
+    print(f'  {(after_rides - before) / len(rides):.1f} bytes per ride')
+    print(f'  {(after_events - after_rides) / len(events):.1f} bytes '
+          f'per event')
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        RIDES_FILE = os.path.join(tmp, 'rides.csv')
+        write_rides(RIDES_FILE, NUM_RIDES)
+        profile_parse_datetime(RIDES_FILE)
+        profile_memory(RIDES_FILE)
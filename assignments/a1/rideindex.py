@@ -0,0 +1,185 @@
+"""Assignment 1 - Ride interval index
+
+=== Module Description ===
+
+This file contains the RideIndex class, which indexes a collection of rides
+by the interval of time each one is active, so that a simulation can find the
+rides active at any time, or the rides that started or ended between two
+times, without looking at every ride.
+
+The rides active at a time are found with a centred interval tree, and the
+rides starting or ending in a range of times with binary search over the
+rides sorted by start and by end time. In both cases a query takes
+O(log n + k) time, where n is the number of rides and k the number returned.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+
+from bikeshare import Ride
+
+
+class RideIndex:
+    """An index of rides by the interval of time each one is active.
+
+    A ride is active from its start_minute to its end_minute, inclusive.
+    Every query returns rides in the order they were given to the index.
+
+    === Private Attributes ===
+    _rides:
+        the indexed rides, in the order they were given
+    _position:
+        maps each ride to its position in _rides
+    _by_start:
+        the indexed rides, in order of start time
+    _start_keys:
+        the start minute of each ride in _by_start
+    _by_end:
+        the indexed rides, in order of end time
+    _end_keys:
+        the end minute of each ride in _by_end
+    _tree:
+        the root of the interval tree over the rides, or None if there
+        are no rides
+
+    === Representation Invariants ===
+    - _start_keys is sorted, and _start_keys[i] == _by_start[i].start_minute
+    - _end_keys is sorted, and _end_keys[i] == _by_end[i].end_minute
+    """
+    _rides: List[Ride]
+    _position: Dict[Ride, int]
+    _by_start: List[Ride]
+    _start_keys: List[int]
+    _by_end: List[Ride]
+    _end_keys: List[int]
+    _tree: Optional['_IntervalNode']
+
+    def __init__(self, rides: Iterable[Ride]) -> None:
+        """Initialize an index of <rides>.
+        """
+        self._rides = list(rides)
+        self._position = {ride: i for i, ride in enumerate(self._rides)}
+        self._by_start = sorted(self._rides, key=lambda r: r.start_minute)
+        self._start_keys = [ride.start_minute for ride in self._by_start]
+        self._by_end = sorted(self._rides, key=lambda r: r.end_minute)
+        self._end_keys = [ride.end_minute for ride in self._by_end]
+        self._tree = _build_tree(self._rides)
+
+    def __len__(self) -> int:
+        """Return the number of rides in this index.
+        """
+        return len(self._rides)
+
+    def active_at(self, minute: int) -> List[Ride]:
+        """Return the rides that are active at <minute>.
+        """
+        found = []
+        node = self._tree
+        while node is not None:
+            if minute < node.center:
+                # Every ride here ends at or after the centre, so it is
+                # active iff it has started
+                for ride in node.by_start:
+                    if ride.start_minute > minute:
+                        break
+                    found.append(ride)
+                node = node.left
+            elif minute > node.center:
+                # Every ride here starts at or before the centre, so it is
+                # active iff it has not yet ended
+                for ride in node.by_end:
+                    if ride.end_minute < minute:
+                        break
+                    found.append(ride)
+                node = node.right
+            else:
+                found.extend(node.by_start)
+                node = None
+        return self.in_order(found)
+
+    def started_between(self, first: int, last: int) -> List[Ride]:
+        """Return the rides that start between minute <first> and minute
+        <last>, inclusive.
+        """
+        lo = bisect_left(self._start_keys, first)
+        hi = bisect_right(self._start_keys, last)
+        return self.in_order(self._by_start[lo:hi])
+
+    def ended_between(self, first: int, last: int) -> List[Ride]:
+        """Return the rides that end between minute <first> and minute
+        <last>, inclusive.
+        """
+        lo = bisect_left(self._end_keys, first)
+        hi = bisect_right(self._end_keys, last)
+        return self.in_order(self._by_end[lo:hi])
+
+    def in_order(self, rides: List[Ride]) -> List[Ride]:
+        """Return <rides> sorted into the order they were given to this index.
+        """
+        return sorted(rides, key=self._position.__getitem__)
+
+
+class _IntervalNode:
+    """A node of a centred interval tree of rides.
+
+    === Attributes ===
+    center:
+        the minute this node is centred on
+    by_start:
+        the rides active at center, in order of start time
+    by_end:
+        the rides active at center, in reverse order of end time
+    left:
+        the subtree of rides that end before center, or None
+    right:
+        the subtree of rides that start after center, or None
+    """
+    center: int
+    by_start: List[Ride]
+    by_end: List[Ride]
+    left: Optional['_IntervalNode']
+    right: Optional['_IntervalNode']
+
+    def __init__(self, center: int, rides: List[Ride],
+                 left: Optional['_IntervalNode'],
+                 right: Optional['_IntervalNode']) -> None:
+        """Initialize a node centred on <center>, holding <rides>.
+        """
+        self.center = center
+        self.by_start = sorted(rides, key=lambda r: r.start_minute)
+        self.by_end = sorted(rides, key=lambda r: r.end_minute, reverse=True)
+        self.left = left
+        self.right = right
+
+
+def _build_tree(rides: List[Ride]) -> Optional[_IntervalNode]:
+    """Return the root of a centred interval tree over <rides>, or None if
+    <rides> is empty.
+    """
+    if not rides:
+        return None
+
+    # Centring on the median endpoint means at most half the rides go to
+    # each subtree, so the tree has O(log n) height
+    endpoints = sorted([ride.start_minute for ride in rides] +
+                       [ride.end_minute for ride in rides])
+    center = endpoints[len(endpoints) // 2]
+
+    left, here, right = [], [], []
+    for ride in rides:
+        if ride.end_minute < center:
+            left.append(ride)
+        elif ride.start_minute > center:
+            right.append(ride)
+        else:
+            here.append(ride)
+    return _IntervalNode(center, here, _build_tree(left), _build_tree(right))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'bisect', 'bikeshare'
+        ]
+    })
@@ -0,0 +1,141 @@
+"""Assignment 1 - Columnar ride table
+
+=== Module Description ===
+
+This file contains the RideTable class, which stores the rides of a
+simulation column by column in NumPy arrays, rather than as one Ride object
+per ride.
+
+Filtering rides by time, sorting them and counting them per station can then
+be done with a handful of array operations, and Ride objects are only created
+for the rides that a simulation actually reaches.
+"""
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from bikeshare import Ride, Station, from_minutes
+
+
+class RideTable:
+    """A table of rides, stored as parallel NumPy arrays.
+
+    Ride i starts at station stations[start_station[i]] at start_minute[i]
+    and ends at station stations[end_station[i]] at end_minute[i], where
+    times are in whole minutes since EPOCH.
+
+    === Public Attributes ===
+    stations:
+        the stations referred to by start_station and end_station
+    start_station:
+        the index in stations of the station where each ride starts
+    end_station:
+        the index in stations of the station where each ride ends
+    start_minute:
+        the minute each ride starts
+    end_minute:
+        the minute each ride ends
+
+    === Representation Invariants ===
+    - start_station, end_station, start_minute and end_minute all have
+      the same length
+    - 0 <= start_station[i], end_station[i] < len(stations)
+    - start_minute[i] < end_minute[i]
+    """
+    stations: List[Station]
+    start_station: np.ndarray
+    end_station: np.ndarray
+    start_minute: np.ndarray
+    end_minute: np.ndarray
+
+    def __init__(self, stations: List[Station],
+                 start_station: np.ndarray, start_minute: np.ndarray,
+                 end_station: np.ndarray, end_minute: np.ndarray) -> None:
+        """Initialize a table of rides from its columns.
+        """
+        self.stations = stations
+        self.start_station = np.asarray(start_station, dtype=np.int32)
+        self.start_minute = np.asarray(start_minute, dtype=np.int64)
+        self.end_station = np.asarray(end_station, dtype=np.int32)
+        self.end_minute = np.asarray(end_minute, dtype=np.int64)
+
+    def __len__(self) -> int:
+        """Return the number of rides in this table.
+        """
+        return len(self.start_minute)
+
+    def __getitem__(self, i: int) -> Ride:
+        """Return a new Ride object for the ride in row <i> of this table.
+        """
+        return Ride(self.stations[self.start_station[i]],
+                    self.stations[self.end_station[i]],
+                    (from_minutes(int(self.start_minute[i])),
+                     from_minutes(int(self.end_minute[i]))))
+
+    def __iter__(self) -> Iterator[Ride]:
+        """Yield a new Ride object for each row of this table, in order.
+        """
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, rows: np.ndarray) -> 'RideTable':
+        """Return a new table containing the given rows of this table.
+
+        <rows> is either an array of row indices, a boolean mask or a slice.
+        """
+        return RideTable(self.stations,
+                         self.start_station[rows], self.start_minute[rows],
+                         self.end_station[rows], self.end_minute[rows])
+
+    def starting_between(self, first: int, last: int) -> 'RideTable':
+        """Return a new table of the rides that start between minute <first>
+        and minute <last>, inclusive.
+        """
+        return self.take((self.start_minute >= first) &
+                         (self.start_minute <= last))
+
+    def active_between(self, first: int, last: int) -> 'RideTable':
+        """Return a new table of the rides that are active at some time
+        between minute <first> and minute <last>, inclusive.
+        """
+        return self.take((self.start_minute <= last) &
+                         (self.end_minute >= first))
+
+    def sorted_by_start(self) -> 'RideTable':
+        """Return a new table of these rides in order of start time.
+
+        Rides that start at the same time stay in the same order.
+        """
+        return self.take(np.argsort(self.start_minute, kind='stable'))
+
+    def station_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the number of rides that start, and the number of rides
+        that end, at each station in stations.
+        """
+        n = len(self.stations)
+        return (np.bincount(self.start_station, minlength=n),
+                np.bincount(self.end_station, minlength=n))
+
+    def iter_from(self, first: int) -> Iterator[Ride]:
+        """Yield a new Ride object for each ride that starts at or after
+        minute <first>, in order of start time.
+
+        If the rides are already in order of start time (as they usually
+        are), no columns are copied.
+        """
+        starts = self.start_minute
+        if np.all(starts[1:] >= starts[:-1]):
+            first_row = int(np.searchsorted(starts, first, side='left'))
+            return iter(self.take(slice(first_row, None)))
+        return iter(self.starting_between(first, np.iinfo(np.int64).max)
+                    .sorted_by_start())
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'numpy', 'bikeshare'
+        ]
+    })
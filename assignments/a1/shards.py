@@ -0,0 +1,326 @@
+"""Assignment 1 - Sharded simulation
+
+=== Module Description ===
+
+This file contains run_sharded, which runs one simulation split across
+several worker processes. The stations are partitioned into geographic
+shards, and each worker simulates the stations in its shard.
+
+A worker only holds the rides that start in its shard. Rides that end in a
+different shard are sent on to that shard's worker at synchronisation points
+every <window> simulated minutes: before the workers simulate a window, each
+one reports the rides starting in its shard during that window that end
+elsewhere, and each worker adds the rides arriving at its stations to its
+own event queue.
+
+A station's state depends only on the rides that start or end at it, and a
+ride always starts whatever state its station is in, so every ride arriving
+in a window is known before the window is simulated. The result is therefore
+exactly the same as for a single Simulation, however large or small the
+window.
+"""
+from bisect import bisect_right
+from datetime import datetime
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Set, Tuple
+
+from bikeshare import EPOCH, ONE_MINUTE, Ride, Station, from_minutes, \
+    to_minutes
+from simulation import RideEndEvent, Simulation, create_stations, iter_rides
+
+
+# Default number of simulated minutes between synchronisation points
+SYNC_MINUTES = 60
+
+# Number of seconds to wait for each worker to stop, once a run has failed
+STOP_TIMEOUT = 5
+
+# A ride sent between workers: the index of its start station, its start
+# minute, the index of its end station and its end minute
+RideRecord = Tuple[int, int, int, int]
+
+
+def run_sharded(station_file: str, ride_file: str,
+                start: datetime, end: datetime,
+                num_shards: Optional[int] = None,
+                window: int = SYNC_MINUTES) -> Dict[str, Tuple[str, float]]:
+    """Run a simulation of the stations in <station_file> and the rides in
+    <ride_file> from <start> to <end>, split into <num_shards> shards (by
+    default, one for each CPU), each simulated by its own worker process.
+
+    Return the same statistics as Simulation.calculate_statistics would for
+    a single simulation run from <start> to <end>. The workers exchange
+    rides that cross between shards every <window> simulated minutes.
+
+    Raise a RuntimeError if a worker stops before finishing its shard, once
+    every other worker has been stopped.
+
+    Precondition: start < end
+                  window > 0
+    """
+    stations = create_stations(station_file)
+    shards = partition_stations(stations, num_shards or
+                                multiprocessing.cpu_count())
+    shard_of = {}
+    for i, shard in enumerate(shards):
+        for st_id in shard:
+            shard_of[st_id] = i
+    station_shard = [shard_of[st_id] for st_id in stations]
+
+    connections = []
+    workers = []
+    try:
+        for shard in shards:
+            parent_end, worker_end = multiprocessing.Pipe()
+            connections.append(parent_end)
+            # A forked worker inherits the parent's end of its own pipe and
+            # of every earlier one, so it is given them to close
+            worker = multiprocessing.Process(
+                target=_run_shard,
+                args=(worker_end, list(connections), station_file, ride_file,
+                      shard, start, end, window))
+            worker.start()
+            worker_end.close()
+            workers.append(worker)
+
+        for _ in range(_num_windows(start, end, window)):
+            arrivals = [[] for _ in shards]
+            for conn in connections:
+                for record in conn.recv():
+                    arrivals[station_shard[record[2]]].append(record)
+            for conn, records in zip(connections, arrivals):
+                conn.send(records)
+
+        station_list = list(stations.values())
+        for conn in connections:
+            for i, num_bikes, stats in conn.recv():
+                station_list[i].set_state(num_bikes, stats)
+    except EOFError as error:
+        # A worker has failed, closing its connection: stop every other
+        # worker rather than leave it waiting for arrivals
+        _stop(connections, workers)
+        raise RuntimeError('a shard worker stopped before finishing its '
+                           'shard') from error
+    except BaseException:
+        _stop(connections, workers)
+        raise
+
+    for conn in connections:
+        conn.close()
+    for worker in workers:
+        worker.join()
+
+    return Simulation.from_data(stations, [],
+                                render=False).calculate_statistics()
+
+
+def partition_stations(stations: Dict[str, Station],
+                       num_shards: int) -> List[List[str]]:
+    """Return the ids of <stations> split into at most <num_shards> shards of
+    stations that are near each other.
+
+    The stations are split in two along whichever of longitude or latitude
+    they are more spread out in, and each half is split again, until there
+    are <num_shards> shards. The shards' sizes differ by at most one.
+
+    Precondition: num_shards > 0
+    """
+    ids = list(stations)
+    return _bisect(ids, stations, min(num_shards, max(len(ids), 1)))
+
+
+def _bisect(ids: List[str], stations: Dict[str, Station],
+            num_shards: int) -> List[List[str]]:
+    """Return <ids> split into <num_shards> shards of nearby stations.
+    """
+    if num_shards == 1:
+        return [ids]
+
+    longs = [stations[st_id].location[0] for st_id in ids]
+    lats = [stations[st_id].location[1] for st_id in ids]
+    axis = 0 if max(longs) - min(longs) >= max(lats) - min(lats) else 1
+    ids = sorted(ids, key=lambda st_id: stations[st_id].location[axis])
+
+    left = num_shards // 2
+    split = len(ids) * left // num_shards
+    return (_bisect(ids[:split], stations, left) +
+            _bisect(ids[split:], stations, num_shards - left))
+
+
+def _stop(connections: List[Connection],
+          workers: List[multiprocessing.Process]) -> None:
+    """Close <connections> and stop <workers>, waiting at most STOP_TIMEOUT
+    seconds for each to exit before killing it.
+    """
+    for conn in connections:
+        conn.close()
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join(STOP_TIMEOUT)
+        if worker.is_alive():
+            # A worker forked from a process with its own SIGTERM handler
+            # (pygame sets one) may ignore terminate
+            worker.kill()
+            worker.join()
+
+
+def _num_windows(start: datetime, end: datetime, window: int) -> int:
+    """Return the number of windows of <window> minutes a run from <start>
+    to <end> is split into.
+
+    The events at <start> itself are always simulated in a window, even if
+    the run is less than a minute long.
+    """
+    last_step = (end - start) // ONE_MINUTE
+    return max(1, -(-last_step // window))
+
+
+def _run_shard(conn: Connection, inherited: List[Connection],
+               station_file: str, ride_file: str, shard: List[str],
+               start: datetime, end: datetime, window: int) -> None:
+    """Simulate the stations whose ids are in <shard> from <start> to <end>,
+    exchanging rides with the other shards through <conn>.
+
+    This is run by each worker process. <inherited> are the parent process's
+    ends of the pipes to the workers, which the worker closes straight away.
+    Otherwise, a worker waiting for arrivals would hold its own pipe open,
+    and would never see the parent close it.
+    """
+    for parent_end in inherited:
+        parent_end.close()
+    stations = create_stations(station_file)
+    sim = _ShardSimulation.for_shard(stations, shard, ride_file, start)
+    sim.run_shard(conn, start, end, window)
+    conn.close()
+
+
+class _ShardSimulation(Simulation):
+    """A simulation of the stations in one shard of a larger simulation.
+
+    all_stations holds only the stations in the shard, and all_rides only
+    the rides that start in it. The rides that arrive in the shard from
+    elsewhere are added as the simulation runs.
+
+    === Private Attributes ===
+      _members:
+         the stations in this shard
+      _station_list:
+         every station in the full simulation, in the order of the stations
+         file
+      _index:
+         maps each station in _station_list to its position there
+      _leaving:
+         the rides in all_rides that end outside this shard, in order of
+         start time
+      _leaving_starts:
+         the start minute of each ride in _leaving
+      _sent:
+         the number of rides in _leaving that have been sent to other shards
+
+    === Representation Invariants ===
+    - _leaving_starts[i] == _leaving[i].start_minute
+    """
+    _members: Set[Station]
+    _station_list: List[Station]
+    _index: Dict[Station, int]
+    _leaving: List[Ride]
+    _leaving_starts: List[int]
+    _sent: int
+
+    @classmethod
+    def for_shard(cls, stations: Dict[str, Station], shard: List[str],
+                  ride_file: str, start: datetime) -> '_ShardSimulation':
+        """Return a simulation of the stations in <stations> whose ids are in
+        <shard>, and the rides in <ride_file> that start at them at or after
+        <start>.
+        """
+        in_shard = {st_id: stations[st_id] for st_id in shard}
+        members = set(in_shard.values())
+        # Only the rides starting at or after this minute are run
+        first_minute = -((EPOCH - start) // ONE_MINUTE)
+        rides = [ride for ride in iter_rides(ride_file, stations)
+                 if ride.start in members and
+                 ride.start_minute >= first_minute]
+
+        sim = cls.from_data(in_shard, rides, render=False)
+        sim._members = members
+        sim._station_list = list(stations.values())
+        sim._index = {station: i
+                      for i, station in enumerate(sim._station_list)}
+        sim._leaving = sorted((ride for ride in rides
+                               if ride.end not in sim._members),
+                              key=lambda ride: ride.start_minute)
+        sim._leaving_starts = [ride.start_minute for ride in sim._leaving]
+        sim._sent = 0
+        return sim
+
+    def run_shard(self, conn: Connection, start: datetime, end: datetime,
+                  window: int) -> None:
+        """Run this shard from <start> to <end>, as run_headless would,
+        exchanging rides with the other shards through <conn> every
+        <window> minutes. Finally, send the state of each station in this
+        shard through <conn>.
+        """
+        self._init_ride_event_pq(start)
+        start_minute = to_minutes(start)
+        last_step = (end - start) // ONE_MINUTE
+
+        step = 0
+        for _ in range(_num_windows(start, end, window)):
+            next_step = min(step + window, last_step)
+            conn.send(self._leaving_until(start_minute + next_step))
+            self._add_arrivals(conn.recv())
+
+            if step == 0:
+                self._process_events(start_minute)
+            self._advance(start_minute, step, next_step)
+            step = next_step
+
+        self._finish_run(start, end)
+        conn.send([(self._index[station], station.num_bikes, station.stats)
+                   for station in self.all_stations.values()])
+
+    def update_station(self, station: Station, event: str) -> None:
+        """Update the state of <station> after a ride <event> event occurs
+        at it, if it is in this shard.
+
+        A ride that leaves this shard ends in the shard it arrives in, so
+        its end is ignored here.
+        """
+        if station in self._members:
+            Simulation.update_station(self, station, event)
+
+    def _leaving_until(self, minute: int) -> List[RideRecord]:
+        """Return the rides leaving this shard that start at or before
+        <minute>, and have not already been returned.
+        """
+        end = bisect_right(self._leaving_starts, minute)
+        records = [(self._index[ride.start], ride.start_minute,
+                    self._index[ride.end], ride.end_minute)
+                   for ride in self._leaving[self._sent:end]]
+        self._sent = end
+        return records
+
+    def _add_arrivals(self, records: List[RideRecord]) -> None:
+        """Add the rides in <records>, which have started in other shards and
+        end in this one.
+        """
+        for start, start_minute, end, end_minute in records:
+            ride = Ride(self._station_list[start], self._station_list[end],
+                        (from_minutes(start_minute), from_minutes(end_minute)))
+            self.active_rides[ride] = None
+            self._ride_event_pq.add(RideEndEvent(self, ride))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['run_sharded'],
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'bisect', 'datetime', 'multiprocessing',
+            'multiprocessing.connection', 'bikeshare', 'simulation'
+        ]
+    })
@@ -12,77 +12,222 @@ This file contains the Simulation class, which is the main class for the
 bike-share simulation.
 """
 import csv
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 import json
-from typing import Dict, List, Tuple
-
-from bikeshare import Ride, Station
-from container import PriorityQueue
-from visualizer import Visualizer
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Type, \
+    Union
+
+import numpy as np
+
+from bikeshare import EPOCH, ONE_MINUTE, Ride, Station, from_minutes, \
+    to_minutes
+from checkpoint import Checkpoint
+from container import Container, HeapPriorityQueue
+from datacache import RIDE_RECORD, STATION_RECORD, load_rides, load_stations, \
+    map_rides, save_rides, save_stations, stamp
+from rideindex import RideIndex
+from ridetable import RideTable
+from spatialgrid import SpatialGrid, overlaps
+from stationstats import StationStatistics
+from timeline import Timeline
+from visualizer import FrameExporter, Visualizer
 
 # Datetime format to parse the ride data
 DATETIME_FORMAT = '%Y-%m-%d %H:%M'
 
+# Number of recently seen dates remembered by parse_datetime
+DATE_CACHE_SIZE = 64
+
+# Default number of simulated minutes between checkpoints
+CHECKPOINT_MINUTES = 60
+
 
 class Simulation:
     """Runs the core of the simulation through time.
 
     === Public Attributes ===
     all_rides:
-        A list of all the rides in this simulation.
+        A list of all the rides in this simulation, or a RideTable of them.
         Note that not all rides might be used, depending on the timeframe
         when the simulation is run.
+        This list is empty if the rides are streamed from the ride file.
     active_rides:
-        A list of all rides currently active in the simulation
+        All rides currently active in the simulation, in the order they
+        started. This is a dictionary whose keys are the rides (and whose
+        values are all None), so that a ride can be added or removed in
+        constant time.
     all_stations:
         A dictionary containing all the stations in this simulation.
     visualizer:
-        A helper class for visualizing the simulation.
+        A helper class for visualizing the simulation, or None if this
+        simulation is not rendered.
 
     === Private Attributes ===
       _ride_event_pq:
          A priority queue containing all ride events in order of most recently
          occurring ride events, to least recently occurring ride events
+      _queue_type:
+         The priority queue class used to create _ride_event_pq
+      _ride_file:
+         The file the rides are read from, if they are streamed, or None if
+         they have all been loaded into all_rides
+      _ride_stream:
+         The rides that have not yet been added to _ride_event_pq, in order
+         of start time, if the rides are streamed
+      _next_ride:
+         The next ride in _ride_stream, or None if there are no more rides
+      _station_stats:
+         The stations' state and statistics as arrays, if they are updated
+         all at once, or None if each Station is updated separately
+      _ride_index:
+         An index of all_rides by the time each ride is active, or None if
+         it has not been needed yet
+      _last_update:
+         The minute (since EPOCH) of the last call to _update_active_rides,
+         or None if it has not been called
+      _initial_bikes:
+         The number of bikes at each station in all_stations when this
+         simulation was created
+      _timeline:
+         A log of every ride event with checkpoints of the stations' bike
+         counts, or None if it has not been needed yet
 
     === Representation invariants ==
-    active_rides[i].start.time >= the current time of the simulation
+    ride.start_time <= the current time of the simulation,
+      for every ride in active_rides
     """
     all_stations: Dict[str, 'Station']
-    all_rides: List[Ride]
-    active_rides: List[Ride]
-    visualizer: Visualizer
-    _ride_event_pq: PriorityQueue
-
-    def __init__(self, station_file: str, ride_file: str) -> None:
+    all_rides: Union[List[Ride], RideTable]
+    active_rides: Dict[Ride, None]
+    visualizer: Optional[Visualizer]
+    _ride_event_pq: Container
+    _queue_type: Type[Container]
+    _ride_file: Optional[str]
+    _ride_stream: Iterator[Ride]
+    _next_ride: Optional[Ride]
+    _station_stats: Optional[StationStatistics]
+    _ride_index: Optional[RideIndex]
+    _last_update: Optional[int]
+    _initial_bikes: List[int]
+    _timeline: Optional[Timeline]
+
+    def __init__(self, station_file: str, ride_file: str,
+                 queue_type: Type[Container] = HeapPriorityQueue,
+                 render: bool = True, stream_rides: bool = False,
+                 columnar: bool = False,
+                 vectorised_stats: bool = False,
+                 mapped: bool = False) -> None:
         """Initialize this simulation with the stations specified in
         <station_file> and the rides specified in <ride_file>.
+
+        If <render> is False, no Visualizer is created (so pygame never opens
+        a window), and run returns as soon as the end time is reached.
+
+        <queue_type> is the priority queue class used to hold ride events;
+        it must implement every method of Container, including
+        from_iterable and peek. Both PriorityQueue and HeapPriorityQueue
+        behave identically, but HeapPriorityQueue adds events in O(log n)
+        rather than O(n) time.
+
+        If <stream_rides> is True, the rides are not loaded up front. Instead,
+        each run reads <ride_file> as it goes, adding each ride to the event
+        queue only once the simulation reaches its start time, so that only
+        the rides in progress are held in memory.
+        Precondition: if stream_rides is True, the rides in <ride_file> are
+                      in non-decreasing order of start time.
+
+        If <columnar> is True (and <stream_rides> is not), all_rides is a
+        RideTable rather than a list, and each run creates Ride objects only
+        for the rides it reaches, as their start times are reached.
+
+        If <vectorised_stats> is True, the stations' statistics are kept in a
+        StationStatistics and updated for every station at once, rather than
+        by calling update_statistics on each Station. The stats of each
+        Station are brought up to date at the end of each run.
+
+        If <mapped> is True (and <stream_rides> is not), all_rides is a
+        RideTable whose columns are memory-mapped read-only from the cache
+        of <ride_file>, as in create_ride_table. Every simulation of the same
+        rides, in any process, then shares one copy of them.
         """
-        self.visualizer = Visualizer()
         self.all_stations = create_stations(station_file)
-        self.all_rides = create_rides(ride_file, self.all_stations)
-        self.active_rides = []
-        self._ride_event_pq = PriorityQueue()
-
-    def run(self, start: datetime, end: datetime) -> None:
-        """Run the simulation from <start> to <end>.
-        Precondition: start < end
+        if stream_rides:
+            self.all_rides = []
+            self._ride_file = ride_file
+        elif columnar or mapped:
+            self.all_rides = create_ride_table(ride_file, self.all_stations,
+                                               mapped)
+            self._ride_file = None
+        else:
+            self.all_rides = create_rides(ride_file, self.all_stations)
+            self._ride_file = None
+        self._setup(queue_type, render, vectorised_stats)
+
+    @classmethod
+    def from_data(cls, stations: Dict[str, 'Station'],
+                  rides: Union[List[Ride], RideTable],
+                  queue_type: Type[Container] = HeapPriorityQueue,
+                  render: bool = True,
+                  vectorised_stats: bool = False) -> 'Simulation':
+        """Return a new simulation of <stations> and <rides>, which have
+        already been loaded (by create_stations and create_rides or
+        create_ride_table).
+
+        The other arguments are as for Simulation.__init__. The simulation
+        uses <stations> and <rides> directly rather than copying them, so
+        running it changes the state of <stations>.
+        """
+        sim = cls.__new__(cls)
+        sim.all_stations = stations
+        sim.all_rides = rides
+        sim._ride_file = None
+        sim._setup(queue_type, render, vectorised_stats)
+        return sim
+
+    def _setup(self, queue_type: Type[Container], render: bool,
+               vectorised_stats: bool) -> None:
+        """Initialize the state of this simulation, once all_stations,
+        all_rides and _ride_file have been set.
         """
-        step = timedelta(minutes=1)  # Each iteration spans one minute of time
-        st_to_draw = list(self.all_stations.values())
-        current = start  # Sets current time to simulation start time
+        self.visualizer = Visualizer() if render else None
+        self.active_rides = {}
+        self._queue_type = queue_type
+        self._ride_event_pq = queue_type()
+        self._ride_stream = iter([])
+        self._next_ride = None
+        if vectorised_stats:
+            self._station_stats = StationStatistics(
+                list(self.all_stations.values()))
+        else:
+            self._station_stats = None
+        self._ride_index = None
+        self._last_update = None
+        self._initial_bikes = [station.num_bikes
+                               for station in self.all_stations.values()]
+        self._timeline = None
+
+    def run(self, start: datetime, end: datetime, minutes_per_frame: int = 1,
+            fps: Optional[float] = None) -> None:
+        """Run the simulation from <start> to <end>.
 
-        # Adds all rides that start after or during start time to _ride_event_pq
-        self._init_ride_event_pq(start)
+        Each frame rendered advances the simulation by <minutes_per_frame>
+        minutes, so a long run can be watched quickly. If <fps> is given,
+        at most <fps> frames are rendered each second; otherwise frames are
+        rendered as fast as possible. The map can be panned and zoomed while
+        the simulation runs. Closing the window only takes effect once the
+        end time is reached, so the results are always for the whole run.
 
-        # Simulation Loop (halt when current time exceeds end time)
-        while current <= end:
-            self._update_active_rides_fast(current)
-            self.visualizer.render_drawables(st_to_draw+self.active_rides,
-                                             current)
-            if current != end:
-                self._update_statistics()
+        The results are the same whatever <minutes_per_frame> and <fps> are,
+        and if this simulation is not rendered they are ignored.
+        Precondition: start < end
+                      minutes_per_frame > 0
+        """
+        if self.visualizer is None:
+            self.run_headless(start, end)
+            return
 
-            current += step
+        self._play(self.visualizer, start, end, minutes_per_frame, fps)
 
         # Leave this code at the very bottom of this method.
         # It will keep the visualization window open until you close
@@ -91,6 +236,178 @@ class Simulation:
             if self.visualizer.handle_window_events():
                 return  # Stop the simulation
 
+    def export(self, start: datetime, end: datetime,
+               output: Union[str, BinaryIO],
+               minutes_per_frame: int = 1) -> None:
+        """Run the simulation from <start> to <end>, writing each frame to
+        <output> rather than showing it in a window.
+
+        <output> is either a file name containing '{}', which is formatted
+        with each frame's number to give the name of the PNG file to save
+        it in (e.g. 'frames/{:05}.png'), or a binary file (such as a pipe to
+        a video encoder) that the raw RGB pixels of each frame are written
+        to. The frames are drawn and written in a background thread while
+        the simulation runs. This works whether or not this simulation is
+        rendered, and needs no display.
+
+        The results are the same as for run.
+        Precondition: start < end
+                      minutes_per_frame > 0
+        """
+        exporter = FrameExporter(output)
+        try:
+            self._play(exporter, start, end, minutes_per_frame, None)
+        finally:
+            exporter.close()
+
+    def _play(self, visualizer: Union[Visualizer, FrameExporter],
+              start: datetime, end: datetime, minutes_per_frame: int,
+              fps: Optional[float]) -> None:
+        """Run the simulation from <start> to <end>, rendering a frame with
+        <visualizer> every <minutes_per_frame> minutes, and at most <fps>
+        frames each second if <fps> is not None.
+        """
+        stations = list(self.all_stations.values())
+        grid = SpatialGrid(stations,
+                           [station.get_bounds() for station in stations])
+        area = None
+        st_to_draw = []
+        start_minute = to_minutes(start)
+        last_step = (end - start) // ONE_MINUTE  # The last minute run reaches
+
+        # Adds all rides that start after or during start time to _ride_event_pq
+        self._init_ride_event_pq(start)
+        self._process_events(start_minute)
+
+        # Simulation Loop (halt when the end time is reached). The simulation
+        # jumps from event to event between frames, so only the rendering
+        # takes time proportional to the number of frames.
+        current_step = 0
+        while True:
+            # Only draw the stations and rides that can be seen, looking the
+            # stations up again only when the visible area changes
+            visible = visualizer.visible_area()
+            if visible != area:
+                area = visible
+                st_to_draw = grid.query(area)
+            rides_to_draw = [ride for ride in self.active_rides
+                             if overlaps(ride.get_bounds(), area)]
+            visualizer.render_drawables(st_to_draw + rides_to_draw,
+                                        start + current_step * ONE_MINUTE)
+            if current_step == last_step:
+                break
+
+            next_step = min(current_step + minutes_per_frame, last_step)
+            self._advance(start_minute, current_step, next_step)
+            current_step = next_step
+
+            if fps is not None:
+                visualizer.wait_for_frame(fps)
+            visualizer.handle_view_events()
+
+        self._finish_run(start, end)
+
+    def run_headless(self, start: datetime, end: datetime,
+                     checkpoint_file: Optional[str] = None,
+                     checkpoint_every: int = CHECKPOINT_MINUTES) -> None:
+        """Run the simulation from <start> to <end> without rendering it.
+
+        This gives exactly the same results as run, but rather than stepping
+        through every minute it jumps straight from one event to the next,
+        updating the statistics for all the minutes in between at once.
+
+        If <checkpoint_file> is given, the state of the run is saved to it
+        every <checkpoint_every> simulated minutes, so that the run can be
+        continued with resume if it is interrupted.
+        Precondition: start < end
+                      checkpoint_every > 0
+        """
+        self._init_ride_event_pq(start)
+        self._process_events(to_minutes(start))
+        self._run_steps(start, end, 0, checkpoint_file, checkpoint_every)
+
+    def resume(self, checkpoint_file: str,
+               checkpoint_every: int = CHECKPOINT_MINUTES) -> None:
+        """Continue the run saved in <checkpoint_file> from where it was
+        saved, until the end time it was given.
+
+        As in run_headless, the state of the run continues to be saved to
+        <checkpoint_file> every <checkpoint_every> simulated minutes.
+
+        Raise a ValueError if <checkpoint_file> is not a checkpoint, or was
+        saved by a simulation with a different number of stations.
+
+        Precondition: this simulation has not been run, and was created from
+                      the same files as the one that saved the checkpoint
+                      checkpoint_every > 0
+        """
+        checkpoint = Checkpoint.load(checkpoint_file)
+        self._restore_checkpoint(checkpoint)
+        self._run_steps(checkpoint.start, checkpoint.end, checkpoint.step,
+                        checkpoint_file, checkpoint_every)
+
+    def _run_steps(self, start: datetime, end: datetime, current_step: int,
+                   checkpoint_file: Optional[str],
+                   checkpoint_every: int) -> None:
+        """Continue a headless run from <start> to <end>, which has reached
+        <current_step> minutes after <start>, saving a checkpoint to
+        <checkpoint_file> (if it is not None) every <checkpoint_every>
+        minutes.
+
+        Precondition: every event up to <current_step> minutes after
+                      <start> has been processed.
+        """
+        start_minute = to_minutes(start)
+        last_step = (end - start) // ONE_MINUTE  # The last minute run reaches
+        next_checkpoint = current_step + checkpoint_every
+
+        while current_step < last_step:
+            next_step = last_step
+            if checkpoint_file is not None:
+                next_step = min(next_checkpoint, next_step)
+            self._advance(start_minute, current_step, next_step)
+            current_step = next_step
+
+            if checkpoint_file is not None and current_step == next_checkpoint:
+                self._save_checkpoint(checkpoint_file, start, end,
+                                      current_step)
+                next_checkpoint += checkpoint_every
+
+        self._finish_run(start, end)
+
+    def _advance(self, start_minute: int, current_step: int,
+                 next_step: int) -> None:
+        """Process every event from <current_step> minutes after
+        <start_minute> up to and including <next_step> minutes after it,
+        updating the statistics for the minutes in between.
+
+        Precondition: every event up to <current_step> minutes after
+                      <start_minute> has been processed.
+        """
+        # Each iteration spans the minutes until the next event occurs. Since
+        # events happen on whole minutes, an event is processed
+        # <minute - start_minute> steps after the start.
+        while current_step < next_step:
+            step = next_step
+            next_minute = self._next_event_minute()
+            if next_minute is not None:
+                step = min(next_minute - start_minute, step)
+
+            self._update_statistics(60 * (step - current_step))
+            current_step = step
+            self._process_events(start_minute + current_step)
+
+    def _finish_run(self, start: datetime, end: datetime) -> None:
+        """Finish a headless run from <start> to <end>, once every event up to
+        its last whole minute has been processed.
+        """
+        # run also updates statistics for its final minute when <end> does
+        # not fall exactly on a minute after <start>
+        if start + (end - start) // ONE_MINUTE * ONE_MINUTE != end:
+            self._update_statistics()
+
+        self._write_back_statistics()
+
     def calculate_statistics(self) -> Dict[str, Tuple[str, float]]:
         """Return a dictionary containing statistics for this simulation.
 
@@ -106,6 +423,8 @@ class Simulation:
         the maximum value of the quantity specified by that key,
         and the second element is the value of that quantity.
         """
+        if self._station_stats is not None:
+            return self._station_stats.maxima()
 
         stats = {
             'max_start': ('', -1),
@@ -120,21 +439,99 @@ class Simulation:
 
         return stats
 
+    def state_at(self, time: datetime) -> Tuple[Dict[str, int], List[Ride]]:
+        """Return the state of this simulation at <time>, as if it had been
+        run from before its first ride.
+
+        The state is returned as a tuple of two elements: a dictionary
+        mapping each station id to the number of bikes at that station, and
+        a list of the rides that are active, in the order they started.
+
+        This does not change the state of this simulation. The first call
+        logs every ride event; after that, each call replays at most
+        timeline.CHECKPOINT_INTERVAL minutes of events, wherever <time> is.
+
+        Raise a ValueError if the rides are streamed from the ride file,
+        since they are then never all loaded.
+        """
+        if self._ride_file is not None:
+            raise ValueError('state_at needs every ride loaded, but the rides '
+                             'are streamed from ' + self._ride_file)
+        if self._timeline is None:
+            self._timeline = Timeline(list(self.all_stations.values()),
+                                      self._initial_bikes, self.all_rides)
+
+        minute = to_minutes(time)
+        bikes = dict(zip(self.all_stations, self._timeline.bikes_at(minute)))
+
+        # A ride's end event is processed at its end minute, so it is no
+        # longer active then
+        active = [ride for ride in self._get_ride_index().active_at(minute)
+                  if ride.end_minute > minute]
+        active.sort(key=lambda ride: ride.start_minute)
+        return bikes, active
+
+    def update_station(self, station: Station, event: str) -> None:
+        """Update the state of <station> after a ride <event> event occurs
+        at it, as in Station.update_state.
+
+        Precondition: station is in self.all_stations.values()
+        """
+        station.update_state(event)
+        if self._station_stats is not None:
+            self._station_stats.update_station(station)
+
     # Helper Functions
     def _update_active_rides(self, time: datetime) -> None:
         """Update this simulation's list of active rides for
         the time <time>.
+
+        A ride is active at <time> if it starts at or before <time> and ends
+        at or after it. Rather than checking every ride, the rides are looked
+        up in an index of the minutes they are active, so <time> must be a
+        whole minute. Moving forward in time only looks at the rides that
+        started or ended since the last update. The rides that have started
+        or ended are still processed in the order of all_rides, since a
+        station that is full or empty may turn a ride away depending on that
+        order.
+
+        Precondition: time is a whole number of minutes after EPOCH
         """
-        for ride in self.all_rides:
-            prev_active = ride in self.active_rides
-            curr_active = (time >= ride.start_time) and (time <= ride.end_time)
+        minute = to_minutes(time)
+        index = self._get_ride_index()
+
+        if self._last_update is not None and self._last_update <= minute:
+            started = [ride for ride in
+                       index.started_between(self._last_update + 1, minute)
+                       if ride.end_minute >= minute and
+                       ride not in self.active_rides]
+            ended = [ride for ride in
+                     index.ended_between(self._last_update, minute - 1)
+                     if ride in self.active_rides]
+        else:
+            now_active = index.active_at(minute)
+            started = [ride for ride in now_active
+                       if ride not in self.active_rides]
+            still_active = set(now_active)
+            ended = [ride for ride in self.active_rides
+                     if ride not in still_active]
+        self._last_update = minute
+
+        # No ride is in both started and ended
+        for ride in index.in_order(started + ended):
+            if ride in self.active_rides:
+                self.update_station(ride.end, 'end')
+                del self.active_rides[ride]
+            else:
+                self.update_station(ride.start, 'start')
+                self.active_rides[ride] = None
 
-            if prev_active and not curr_active:
-                ride.end.update_state('end')
-                self.active_rides.remove(ride)
-            elif not prev_active and curr_active:
-                ride.start.update_state('start')
-                self.active_rides.append(ride)
+    def _get_ride_index(self) -> RideIndex:
+        """Return an index of all_rides, building it if necessary.
+        """
+        if self._ride_index is None:
+            self._ride_index = RideIndex(self.all_rides)
+        return self._ride_index
 
     def _update_active_rides_fast(self, time: datetime) -> None:
         """Update this simulation's list of active rides for
@@ -143,19 +540,25 @@ class Simulation:
         Note: This method should be preferred over _update_active_rides
         since it is much more efficient, and behaves precisely the same.
         """
-        while not self._ride_event_pq.is_empty():
-            ride_event = self._ride_event_pq.remove()
+        self._process_events(to_minutes(time))
 
-            # Process event if it occurs during/before current time,
-            # Otherwise add event back to _ride_event_pq to be processed at
-            # a future time
-            if Event(self, time) < ride_event:
-                self._ride_event_pq.add(ride_event)
-                return
-            else:
-                spawned_events = ride_event.process()
-                for event in spawned_events:
-                    self._ride_event_pq.add(event)
+    def _process_events(self, minute: int) -> None:
+        """Process every event that occurs during/before <minute> minutes
+        after EPOCH, leaving later events in _ride_event_pq to be processed
+        at a future time.
+        """
+        # Add any streamed rides that have started to _ride_event_pq
+        while (self._next_ride is not None and
+               self._next_ride.start_minute <= minute):
+            self._ride_event_pq.add(RideStartEvent(self, self._next_ride))
+            self._next_ride = next(self._ride_stream, None)
+
+        while (not self._ride_event_pq.is_empty() and
+               self._ride_event_pq.peek().minute <= minute):
+            ride_event = self._ride_event_pq.remove()
+            spawned_events = ride_event.process()
+            for event in spawned_events:
+                self._ride_event_pq.add(event)
 
     def _update_max(self, max_stats: Dict[str, Tuple[str, float]],
                     stat: 'str', st_id: 'str') -> None:
@@ -180,19 +583,133 @@ class Simulation:
         elif (max_st_stat == st_stat) and (st_name < max_st_name):
             max_stats[stat] = (st_name, st_stat)
 
-    def _update_statistics(self):
-        """Updates the stats attribute of every station. """
+    def _update_statistics(self, seconds: int = 60) -> None:
+        """Updates the stats attribute of every station, for <seconds>
+        seconds spent in its current state.
+        """
+        if self._station_stats is not None:
+            self._station_stats.update_statistics(seconds)
+            return
+
         for st_id in self.all_stations:
             station = self.all_stations[st_id]
-            station.update_statistics()
+            station.update_statistics(seconds)
+
+    def _write_back_statistics(self) -> None:
+        """Bring the stats of every station up to date, if they are kept in
+        _station_stats.
+        """
+        if self._station_stats is not None:
+            self._station_stats.write_back()
+
+    def _next_event_minute(self) -> Optional[int]:
+        """Return the minute (since EPOCH) of the next event to be processed,
+        or None if there are no more events.
+        """
+        next_minute = None
+        if not self._ride_event_pq.is_empty():
+            next_minute = self._ride_event_pq.peek().minute
+        if self._next_ride is not None and (
+                next_minute is None or
+                self._next_ride.start_minute < next_minute):
+            next_minute = self._next_ride.start_minute
+        return next_minute
 
     def _init_ride_event_pq(self, start: datetime):
         """Initializes the _ride_event_pq with RideStartEvents starting at or
         after <start> time.
         """
-        for ride in self.all_rides:
-            if ride.start_time >= start:
-                self._ride_event_pq.add(RideStartEvent(self, ride))
+        # Rides start on whole minutes, so this is the earliest minute at
+        # which a ride can start at or after <start>
+        self._load_ride_events(-((EPOCH - start) // ONE_MINUTE))
+
+    def _load_ride_events(self, first_minute: int) -> None:
+        """Initializes the _ride_event_pq with RideStartEvents for the rides
+        starting at or after <first_minute> minutes after EPOCH.
+        """
+        if isinstance(self.all_rides, RideTable):
+            # Rides are only created once they are fed to _ride_event_pq
+            self._ride_event_pq = self._queue_type.from_iterable([])
+            self._ride_stream = self.all_rides.iter_from(first_minute)
+            self._next_ride = next(self._ride_stream, None)
+            return
+
+        self._ride_event_pq = self._queue_type.from_iterable(
+            RideStartEvent(self, ride) for ride in self.all_rides
+            if ride.start_minute >= first_minute)
+
+        if self._ride_file is not None:
+            self._ride_stream = (
+                ride for ride in iter_rides(self._ride_file, self.all_stations)
+                if ride.start_minute >= first_minute)
+            self._next_ride = next(self._ride_stream, None)
+
+    def _save_checkpoint(self, checkpoint_file: str, start: datetime,
+                         end: datetime, step: int) -> None:
+        """Save the state of a run from <start> to <end>, which has reached
+        <step> minutes after <start>, to <checkpoint_file>.
+        """
+        self._write_back_statistics()
+        index = {station: i
+                 for i, station in enumerate(self.all_stations.values())}
+
+        stations = []
+        for station in self.all_stations.values():
+            stats = station.stats
+            stations.extend([station.num_bikes, stats['start'], stats['end'],
+                             stats['time_low_availability'],
+                             stats['time_low_unoccupied']])
+        rides = []
+        for ride in self.active_rides:
+            rides.extend([index[ride.start], ride.start_minute,
+                          index[ride.end], ride.end_minute])
+
+        Checkpoint(start, end, step, stations, rides).save(checkpoint_file)
+
+    def _restore_checkpoint(self, checkpoint: Checkpoint) -> None:
+        """Restore the stations, active rides and pending events of this
+        simulation from <checkpoint>.
+        """
+        station_list = list(self.all_stations.values())
+        states = checkpoint.station_states()
+        if len(states) != len(station_list):
+            raise ValueError('checkpoint has {} stations, not {}'.format(
+                len(states), len(station_list)))
+
+        for station, state in zip(station_list, states):
+            station.set_state(state[0], {
+                'start': state[1],
+                'end': state[2],
+                'time_low_availability': state[3],
+                'time_low_unoccupied': state[4]
+            })
+        if self._station_stats is not None:
+            self._station_stats = StationStatistics(station_list)
+
+        # Every event up to this minute has been processed, so the rides
+        # still to start are exactly those that start after it
+        minute = to_minutes(checkpoint.start) + checkpoint.step
+        self._load_ride_events(minute + 1)
+
+        # Use the loaded Ride objects for the active rides, if there are any
+        loaded = {}
+        if isinstance(self.all_rides, list):
+            index = {station: i for i, station in enumerate(station_list)}
+            for ride in self.all_rides:
+                if ride.start_minute <= minute < ride.end_minute:
+                    key = (index[ride.start], ride.start_minute,
+                           index[ride.end], ride.end_minute)
+                    loaded.setdefault(key, []).append(ride)
+
+        self.active_rides = {}
+        for record in checkpoint.ride_records():
+            if loaded.get(record):
+                ride = loaded[record].pop(0)
+            else:
+                ride = Ride(station_list[record[0]], station_list[record[2]],
+                            (from_minutes(record[1]), from_minutes(record[3])))
+            self.active_rides[ride] = None
+            self._ride_event_pq.add(RideEndEvent(self, ride))
 
 
 def create_stations(stations_file: str) -> Dict[str, 'Station']:
@@ -209,22 +726,32 @@ def create_stations(stations_file: str) -> Dict[str, 'Station']:
     >>> test_id in stations
     True
     """
-    # Read in raw data using the json library.
-    with open(stations_file) as file:
-        raw_stations = json.load(file)
+    cached = load_stations(stations_file)
+    if cached is not None:
+        ids, names, records = cached
+    else:
+        source = stamp(stations_file)
+        # Read in raw data using the json library.
+        with open(stations_file) as file:
+            raw_stations = json.load(file)
+
+        ids, names, records = [], [], []
+        for s in raw_stations['stations']:
+            # Extract the relevant fields from the raw station JSON.
+            # s is a dictionary with the keys 'n', 's', 'la', 'lo', 'da', and
+            # 'ba' as described in the assignment handout.
+            bike_count = int(s['da'])
+            ids.append(s['n'])
+            names.append(s['s'])
+            records.append((float(s['lo']), float(s['la']),
+                            bike_count, int(s['ba']) + bike_count))
+        records = np.array(records, dtype=STATION_RECORD)
+        save_stations(stations_file, source, ids, names, records)
 
     stations = {}
-    for s in raw_stations['stations']:
-        # Extract the relevant fields from the raw station JSON.
-        # s is a dictionary with the keys 'n', 's', 'la', 'lo', 'da', and 'ba'
-        # as described in the assignment handout.
-        st_id = s['n']
-        name = s['s']
-        location = (float(s['lo']), float(s['la']))
-        bike_count = int(s['da'])
-        capcity = int(s['ba']) + bike_count
-
-        stations[st_id] = Station(location, capcity, bike_count, name)
+    for st_id, name, record in zip(ids, names, records.tolist()):
+        location = (record[0], record[1])
+        stations[st_id] = Station(location, record[3], record[2], name)
     return stations
 
 
@@ -240,49 +767,205 @@ def create_rides(rides_file: str,
     Precondition: rides_file matches the format specified in the
                   assignment handout.
     """
+    station_ids, records = read_ride_records(rides_file)
+    lookup = [stations.get(st_id) for st_id in station_ids]
+
+    # Many rides start or end in the same minute, so share their datetimes
+    times = {}
     rides = []
+    for start, end, start_minute, end_minute in records.tolist():
+        if lookup[start] is not None and lookup[end] is not None:
+            if start_minute not in times:
+                times[start_minute] = from_minutes(start_minute)
+            if end_minute not in times:
+                times[end_minute] = from_minutes(end_minute)
+            rides.append(Ride(lookup[start], lookup[end],
+                              (times[start_minute], times[end_minute]),
+                              (start_minute, end_minute)))
+    return rides
+
+
+def create_ride_table(rides_file: str, stations: Dict[str, 'Station'],
+                      mapped: bool = False) -> RideTable:
+    """Return a RideTable of the rides described in the given CSV file.
+
+    The table's stations are the values of <stations>, in order. As with
+    create_rides, ignore any ride whose start or end station is not present
+    in <stations>.
+
+    If <mapped> is True, the table's columns are instead read-only views of
+    the rides in the file's cache, memory-mapped rather than read in, so
+    that every process that maps the same file shares one copy of them. The
+    table's stations are then in the order of the station ids in the cache.
+    If the cache cannot be written, or some ride's station is not present
+    in <stations>, the columns are read in as usual.
+
+    Precondition: rides_file matches the format specified in the
+                  assignment handout.
+    """
+    station_ids, records = read_ride_records(rides_file, mapped)
+    if mapped and all(st_id in stations for st_id in station_ids):
+        return RideTable([stations[st_id] for st_id in station_ids],
+                         records['start_station'], records['start_minute'],
+                         records['end_station'], records['end_minute'])
+
+    index = {st_id: i for i, st_id in enumerate(stations)}
+    lookup = np.array([index.get(st_id, -1) for st_id in station_ids] or [-1],
+                      dtype=np.int32)
+
+    start_station = lookup[records['start_station']]
+    end_station = lookup[records['end_station']]
+    keep = (start_station >= 0) & (end_station >= 0)
+    return RideTable(list(stations.values()),
+                     start_station[keep], records['start_minute'][keep],
+                     end_station[keep], records['end_minute'][keep])
+
+
+def read_ride_records(rides_file: str, mapped: bool = False) -> \
+        Tuple[List[str], np.ndarray]:
+    """Return the rides described in the given CSV file, as a list of the
+    station ids they use and an array of datacache.RIDE_RECORD, each
+    referring to its stations by their position in that list.
+
+    Every ride in the file is included, whatever its stations. The rides
+    are read from the file's cache if it is up to date, and otherwise the
+    file is parsed and the cache is written. If <mapped> is True, the array
+    is memory-mapped from the cache rather than read in, if possible.
+
+    Precondition: rides_file matches the format specified in the
+                  assignment handout.
+    """
+    cached = map_rides(rides_file) if mapped else load_rides(rides_file)
+    if cached is not None:
+        return cached
+
+    source = stamp(rides_file)
+    positions = {}
+    rows = []
+    with open(rides_file) as file:
+        for line in csv.reader(file):
+            rows.append((positions.setdefault(line[1], len(positions)),
+                         positions.setdefault(line[3], len(positions)),
+                         to_minutes(parse_datetime(line[0])),
+                         to_minutes(parse_datetime(line[2]))))
+
+    station_ids = list(positions)
+    records = np.array(rows, dtype=RIDE_RECORD)
+    save_rides(rides_file, source, station_ids, records)
+    if mapped:
+        cached = map_rides(rides_file)
+        if cached is not None:
+            return cached
+    return station_ids, records
 
+
+def iter_rides(rides_file: str,
+               stations: Dict[str, 'Station']) -> Iterator['Ride']:
+    """Yield the rides described in the given CSV file, one at a time and in
+    the order they appear in the file.
+
+    Unlike create_rides, only one line of the file is read at a time, so
+    the rides don't all have to fit in memory at once.
+
+    Ignore any ride whose start or end station is not present in <stations>.
+
+    Precondition: rides_file matches the format specified in the
+                  assignment handout.
+    """
     with open(rides_file) as file:
         for line in csv.reader(file):
             try:
-                start_time = datetime.strptime(line[0], DATETIME_FORMAT)
+                start_time = parse_datetime(line[0])
                 start_station = stations[line[1]]
 
-                end_time = datetime.strptime(line[2], DATETIME_FORMAT)
+                end_time = parse_datetime(line[2])
                 end_station = stations[line[3]]
-                rides.append(Ride(start_station, end_station,
-                                  (start_time, end_time)))
             except KeyError:
-                pass
+                continue
+            yield Ride(start_station, end_station, (start_time, end_time))
 
-    return rides
+
+def parse_datetime(text: str) -> datetime:
+    """Return the datetime represented by <text>, in DATETIME_FORMAT.
+
+    This is equivalent to datetime.strptime(text, DATETIME_FORMAT), but
+    much faster for timestamps of the form 'YYYY-MM-DD HH:MM', which are
+    parsed by slicing, remembering the most recently seen dates. Any other
+    text is left to strptime.
+
+    >>> parse_datetime('2017-06-01 07:31')
+    datetime.datetime(2017, 6, 1, 7, 31)
+    >>> parse_datetime('2017-6-1 7:31')
+    datetime.datetime(2017, 6, 1, 7, 31)
+    """
+    if (len(text) == 16 and text[10] == ' ' and text[13] == ':' and
+            text[11:13].isdigit() and text[14:].isdigit()):
+        try:
+            year, month, day = _parse_date(text[:10])
+            return datetime(year, month, day,
+                            int(text[11:13]), int(text[14:]))
+        except ValueError:
+            pass
+    return datetime.strptime(text, DATETIME_FORMAT)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_date(text: str) -> Tuple[int, int, int]:
+    """Return the (year, month, day) represented by <text>, which has the
+    form 'YYYY-MM-DD'.
+
+    Raise a ValueError if <text> does not have this form.
+    """
+    if (text[4] != '-' or text[7] != '-' or not text[:4].isdigit() or
+            not text[5:7].isdigit() or not text[8:].isdigit()):
+        raise ValueError('not a date: ' + text)
+    return int(text[:4]), int(text[5:7]), int(text[8:])
 
 
 class Event:
     """An event in the bike share simulation.
 
-    Events are ordered by their timestamp.
+    Events are ordered by their timestamp. Events with the same timestamp
+    are ordered by their class's rank, so that every ride that starts at
+    a given time is processed before any ride that ends at that time,
+    whatever order the events were added to the simulation in.
 
     === Attributes ===
     simulation:
         the simulation instancce in which the event occurs
     time:
         the time stamp of the event
+    minute:
+        the time stamp of the event, in whole minutes since EPOCH
+
+    === Representation Invariants ===
+    - minute == to_minutes(time)
     """
+    __slots__ = ('simulation', 'time', 'minute')
     simulation: 'Simulation'
     time: datetime
+    minute: int
+    rank = 0
+
+    def __init__(self, simulation: 'Simulation', time: datetime,
+                 minute: Optional[int] = None) -> None:
+        """Initialize a new event.
 
-    def __init__(self, simulation: 'Simulation', time: datetime) -> None:
-        """Initialize a new event."""
+        <minute> may be given to avoid converting <time> again when it is
+        already known.
+        """
         self.simulation = simulation
         self.time = time
+        self.minute = to_minutes(time) if minute is None else minute
 
     def __lt__(self, other: 'Event') -> bool:
         """Return whether this event is less than <other>.
 
-        Events are ordered by their timestamp.
+        Events are ordered by their timestamp, and then by rank.
         """
-        return self.time < other.time
+        if self.minute == other.minute:
+            return self.rank < other.rank
+        return self.minute < other.minute
 
     def process(self) -> List['Event']:
         """Process this event by updating the state of the simulation.
@@ -302,11 +985,12 @@ class RideStartEvent(Event):
     === Representation Invariants ===
     self.time == self.ride.start_time
     """
+    __slots__ = ('ride',)
     ride: Ride
 
     def __init__(self, simulation: 'Simulation', ride: Ride) -> None:
         """Initialize a new RideStartEvent."""
-        Event.__init__(self, simulation, ride.start_time)
+        Event.__init__(self, simulation, ride.start_time, ride.start_minute)
         self.ride = ride
 
     def process(self) -> List['Event']:
@@ -318,8 +1002,8 @@ class RideStartEvent(Event):
         list containing a single RideEndEvent that corresponds with
         the end time of self.ride.
         """
-        self.ride.start.update_state('start')
-        self.simulation.active_rides.append(self.ride)
+        self.simulation.update_station(self.ride.start, 'start')
+        self.simulation.active_rides[self.ride] = None
 
         return [RideEndEvent(self.simulation, self.ride)]
 
@@ -334,11 +1018,13 @@ class RideEndEvent(Event):
     === Representation Invariants ===
     self.time == self.ride.end_time
     """
+    __slots__ = ('ride',)
     ride: Ride
+    rank = 1
 
     def __init__(self, simulation: 'Simulation', ride: Ride) -> None:
         """Initialize a new RideEndEvent."""
-        Event.__init__(self, simulation, ride.end_time)
+        Event.__init__(self, simulation, ride.end_time, ride.end_minute)
         self.ride = ride
 
     def process(self) -> List['Event']:
@@ -348,8 +1034,8 @@ class RideEndEvent(Event):
         Note: This should be an empty list, since there is no case in
         which a RideEndEvent should spawn new events.
         """
-        self.ride.end.update_state('end')
-        self.simulation.active_rides.remove(self.ride)
+        self.simulation.update_station(self.ride.end, 'end')
+        del self.simulation.active_rides[self.ride]
         return []
 
 
@@ -365,11 +1051,13 @@ if __name__ == '__main__':
     # Uncomment these lines when you want to check your work using python_ta!
     import python_ta
     python_ta.check_all(config={
-        'allowed-io': ['create_stations', 'create_rides'],
+        'allowed-io': ['create_stations', 'read_ride_records', 'iter_rides'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'typing',
-            'csv', 'datetime', 'json',
-            'bikeshare', 'container', 'visualizer'
+            'csv', 'datetime', 'functools', 'json', 'numpy',
+            'bikeshare', 'checkpoint', 'container', 'datacache', 'rideindex',
+            'ridetable', 'spatialgrid', 'stationstats', 'timeline',
+            'visualizer'
         ]
     })
     print(sample_simulation())
@@ -0,0 +1,133 @@
+"""Assignment 1 - Spatial grid
+
+=== Module Description ===
+
+This file contains the SpatialGrid class, which divides long/lat space into
+square cells so that the items lying in an area can be found by looking only
+at the cells the area covers, rather than at every item.
+
+An area is given by its bounds: a tuple (min_long, min_lat, max_long,
+max_lat).
+"""
+from math import floor
+from typing import Dict, Generic, List, Tuple, TypeVar
+
+# Ignore this line; it is only used to facilitate PyCharm's typechecking.
+T = TypeVar('T')
+
+Bounds = Tuple[float, float, float, float]
+
+# Default width and height of each cell, in degrees of long/lat
+CELL_SIZE = 0.01
+
+
+def overlaps(first: Bounds, second: Bounds) -> bool:
+    """Return whether the areas <first> and <second> overlap, including
+    just touching at an edge.
+
+    >>> overlaps((0, 0, 1, 1), (1, 1, 2, 2))
+    True
+    >>> overlaps((0, 0, 1, 1), (0, 1.5, 1, 2))
+    False
+    """
+    return (first[0] <= second[2] and second[0] <= first[2] and
+            first[1] <= second[3] and second[1] <= first[3])
+
+
+class SpatialGrid(Generic[T]):
+    """A grid of square cells, each listing the items whose bounds overlap
+    it.
+
+    === Private Attributes ===
+    _items:
+        the items in this grid, in the order they were given
+    _bounds:
+        the bounds of each item in _items
+    _cell_size:
+        the width and height of each cell, in degrees
+    _cells:
+        maps the (column, row) of each cell to the positions in _items of
+        the items whose bounds overlap it, in increasing order
+
+    === Representation Invariants ===
+    - len(_items) == len(_bounds)
+    - _cell_size > 0
+    """
+    _items: List[T]
+    _bounds: List[Bounds]
+    _cell_size: float
+    _cells: Dict[Tuple[int, int], List[int]]
+
+    def __init__(self, items: List[T], bounds: List[Bounds],
+                 cell_size: float = CELL_SIZE) -> None:
+        """Initialize a grid of <items>, where bounds[i] is the bounds of
+        items[i].
+
+        Precondition: len(items) == len(bounds)
+                      cell_size > 0
+        """
+        self._items = list(items)
+        self._bounds = list(bounds)
+        self._cell_size = cell_size
+        self._cells = {}
+        for i, item_bounds in enumerate(self._bounds):
+            for cell in self._cell_range(item_bounds):
+                self._cells.setdefault(cell, []).append(i)
+
+    def __len__(self) -> int:
+        """Return the number of items in this grid.
+        """
+        return len(self._items)
+
+    def query(self, area: Bounds) -> List[T]:
+        """Return the items whose bounds overlap <area>, in the order they
+        were given to this grid.
+        """
+        found = set()
+        for cell in self._cells_in(area):
+            for i in self._cells.get(cell, []):
+                if i not in found and overlaps(self._bounds[i], area):
+                    found.add(i)
+        return [self._items[i] for i in sorted(found)]
+
+    def _cells_in(self, area: Bounds) -> List[Tuple[int, int]]:
+        """Return the (column, row) of every cell holding an item that
+        <area> could overlap.
+
+        If <area> covers more cells than hold items, the cells holding items
+        are checked instead, so that a very large area (such as the whole
+        map) does not mean looking at a very large number of empty cells.
+        """
+        first_col, first_row, last_col, last_row = self._cell_span(area)
+        if ((last_col - first_col + 1) * (last_row - first_row + 1) <=
+                len(self._cells)):
+            return self._cell_range(area)
+        return [(col, row) for col, row in self._cells
+                if first_col <= col <= last_col and
+                first_row <= row <= last_row]
+
+    def _cell_range(self, area: Bounds) -> List[Tuple[int, int]]:
+        """Return the (column, row) of every cell that <area> overlaps.
+        """
+        first_col, first_row, last_col, last_row = self._cell_span(area)
+        return [(col, row) for col in range(first_col, last_col + 1)
+                for row in range(first_row, last_row + 1)]
+
+    def _cell_span(self, area: Bounds) -> Tuple[int, int, int, int]:
+        """Return the first column, first row, last column and last row of
+        the cells that <area> overlaps.
+        """
+        return (floor(area[0] / self._cell_size),
+                floor(area[1] / self._cell_size),
+                floor(area[2] / self._cell_size),
+                floor(area[3] / self._cell_size))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'math'
+        ]
+    })
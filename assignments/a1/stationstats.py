@@ -0,0 +1,121 @@
+"""Assignment 1 - Vectorised station statistics
+
+=== Module Description ===
+
+This file contains the StationStatistics class, which keeps the state and
+statistics of every station in a simulation in NumPy arrays.
+
+Updating the time each station has spent with low availability or low
+unoccupied spots is then a single array operation, rather than a method call
+on every Station, and finding the station with the maximum value of each
+statistic is a single pass over an array.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from bikeshare import Station
+
+
+# The statistics tracked for each station, in the order of STAT_NAMES
+STAT_NAMES = ['start', 'end', 'time_low_availability', 'time_low_unoccupied']
+
+
+class StationStatistics:
+    """The state and statistics of a collection of stations.
+
+    Row i of each array describes stations[i].
+
+    === Public Attributes ===
+    stations:
+        the stations whose statistics are kept
+    num_bikes:
+        the current number of bikes at each station
+    capacity:
+        the total number of bikes each station can store
+    stats:
+        a 4 x len(stations) array, where stats[k] holds the value of the
+        statistic STAT_NAMES[k] for each station
+
+    === Private Attributes ===
+    _index:
+        maps each station to its row in the arrays
+
+    === Representation Invariants ===
+    - 0 <= num_bikes[i] <= capacity[i]
+    - stats[k][i] >= 0
+    """
+    stations: List[Station]
+    num_bikes: np.ndarray
+    capacity: np.ndarray
+    stats: np.ndarray
+    _index: Dict[Station, int]
+
+    def __init__(self, stations: List[Station]) -> None:
+        """Initialize the arrays from the current state of <stations>.
+        """
+        self.stations = stations
+        self._index = {station: i for i, station in enumerate(stations)}
+        self.num_bikes = np.array([st.num_bikes for st in stations],
+                                  dtype=np.int64)
+        self.capacity = np.array([st.capacity for st in stations],
+                                 dtype=np.int64)
+        self.stats = np.array([[st.stats[name] for st in stations]
+                               for name in STAT_NAMES],
+                              dtype=np.int64).reshape(len(STAT_NAMES), -1)
+
+    def update_station(self, station: Station) -> None:
+        """Copy the number of bikes, rides started and rides ended at
+        <station> into the arrays.
+
+        Precondition: station is in self.stations
+        """
+        i = self._index[station]
+        stats = station.stats
+        self.num_bikes[i] = station.num_bikes
+        self.stats[0, i] = stats['start']
+        self.stats[1, i] = stats['end']
+
+    def update_statistics(self, seconds: int = 60) -> None:
+        """Update the low availability and low unoccupied times of every
+        station, for <seconds> seconds spent in its current state.
+        """
+        self.stats[2] += seconds * (self.num_bikes <= 5)
+        self.stats[3] += seconds * (self.capacity - self.num_bikes <= 5)
+
+    def write_back(self) -> None:
+        """Copy the low availability and low unoccupied times in the arrays
+        back into each Station.
+        """
+        for i, station in enumerate(self.stations):
+            station.set_time_low(int(self.stats[2, i]), int(self.stats[3, i]))
+
+    def maxima(self) -> Dict[str, Tuple[str, float]]:
+        """Return the maximum value of each statistic, in the same form as
+        Simulation.calculate_statistics.
+
+        Each key is 'max_' followed by a name in STAT_NAMES. If several
+        stations share the maximum value, the one whose name is smallest
+        is chosen.
+        """
+        result = {}
+        for k, name in enumerate(STAT_NAMES):
+            if not self.stations:
+                result['max_' + name] = ('', -1)
+                continue
+            values = self.stats[k]
+            best = values.max()
+            best_name = min(self.stations[i].name
+                            for i in np.flatnonzero(values == best))
+            result['max_' + name] = (best_name, int(best))
+        return result
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'numpy', 'bikeshare'
+        ]
+    })
@@ -0,0 +1,147 @@
+"""Assignment 1 - Parameter sweeps
+
+=== Module Description ===
+
+This file contains run_sweep, which runs the same simulation many times with
+different station capacities and bike counts, spread across a pool of worker
+processes.
+
+Where the platform starts new processes by forking (as Linux does by
+default), the stations and rides are loaded once, in the parent process, and
+handed to each worker as it starts. The forked workers share the parent's
+copy of the ride data rather than each loading their own. (With
+columnar=True the rides are held in NumPy arrays memory-mapped from the rides
+file's cache, which the workers only read, so their memory stays shared for
+the whole sweep.) Elsewhere, each worker loads the data once when it starts;
+with columnar=True this only maps the same cache, so the workers still share
+one copy of the rides and start at once.
+"""
+from datetime import datetime
+import multiprocessing
+import multiprocessing.pool
+from typing import Dict, List, Optional, Tuple, Union
+
+from bikeshare import Ride, Station
+from ridetable import RideTable
+from simulation import Simulation, create_ride_table, create_rides, \
+    create_stations
+
+
+# A variant maps a station id to the (capacity, num_bikes) it should start
+# with. Stations that are not in the variant keep their values from the file.
+Variant = Dict[str, Tuple[int, int]]
+
+# The data needed to run the variants: the stations, the rides, and the
+# capacity and number of bikes each station has in the stations file.
+SweepData = Tuple[Dict[str, Station], Union[List[Ride], RideTable],
+                  Dict[str, Tuple[int, int]]]
+
+# The data for the variants run by this worker process. It is set when the
+# worker starts, and only ever set in worker processes.
+_worker_data = None
+
+
+def run_sweep(station_file: str, ride_file: str, variants: List[Variant],
+              start: datetime, end: datetime,
+              processes: Optional[int] = None,
+              columnar: bool = False) -> List[Dict[str, Tuple[str, float]]]:
+    """Run a simulation of the stations in <station_file> and the rides in
+    <ride_file> from <start> to <end> once for each variant in <variants>,
+    using a pool of <processes> worker processes (by default, one for each
+    CPU).
+
+    Return the calculate_statistics() result of each run, in the same order
+    as <variants>. If <columnar> is True, the rides are held in a RideTable.
+
+    Precondition: every station id in each variant is in <station_file>, and
+                  0 <= num_bikes <= capacity for each of them.
+                  start < end
+    """
+    tasks = [(variant, start, end) for variant in variants]
+    context = multiprocessing.get_context()
+    if context.get_start_method() == 'fork':
+        # Forked workers inherit the data rather than having it pickled
+        pool = context.Pool(processes, _init_worker,
+                            (_load(station_file, ride_file, columnar),))
+    else:
+        pool = context.Pool(processes, _load_worker,
+                            (station_file, ride_file, columnar))
+    return _map(pool, tasks)
+
+
+def _map(pool: multiprocessing.pool.Pool,
+         tasks: List[Tuple[Variant, datetime, datetime]]) -> \
+        List[Dict[str, Tuple[str, float]]]:
+    """Run every task in <tasks> on <pool>, then shut the pool down.
+
+    The workers are asked to exit once the tasks are done, rather than sent
+    SIGTERM as a with block would do: a worker forked from a process that
+    has set up its own SIGTERM handler (pygame does) may never exit.
+    """
+    try:
+        return pool.map(_run_variant, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _load(station_file: str, ride_file: str, columnar: bool) -> SweepData:
+    """Return the stations and rides in the given files, and the capacity
+    and number of bikes each station starts with.
+    """
+    stations = create_stations(station_file)
+    if columnar:
+        rides = create_ride_table(ride_file, stations, mapped=True)
+    else:
+        rides = create_rides(ride_file, stations)
+    initial = {st_id: (station.capacity, station.num_bikes)
+               for st_id, station in stations.items()}
+    return stations, rides, initial
+
+
+def _init_worker(data: SweepData) -> None:
+    """Use <data>, loaded by the parent process, for the variants run by
+    this worker process.
+    """
+    global _worker_data
+    _worker_data = data
+
+
+def _load_worker(station_file: str, ride_file: str, columnar: bool) -> None:
+    """Load the data for the variants run by this worker process, when it
+    cannot be inherited from the parent process.
+    """
+    _init_worker(_load(station_file, ride_file, columnar))
+
+
+def _run_variant(task: Tuple[Variant, datetime, datetime]) -> \
+        Dict[str, Tuple[str, float]]:
+    """Run the simulation for one variant, and return its statistics.
+
+    The worker's stations are reset before each run, since a worker may run
+    several variants.
+    """
+    variant, start, end = task
+    stations, rides, initial = _worker_data
+
+    zero = {'start': 0, 'end': 0,
+            'time_low_availability': 0, 'time_low_unoccupied': 0}
+    for st_id, station in stations.items():
+        capacity, num_bikes = variant.get(st_id, initial[st_id])
+        station.capacity = capacity
+        station.set_state(num_bikes, zero)
+
+    sim = Simulation.from_data(stations, rides, render=False)
+    sim.run(start, end)
+    return sim.calculate_statistics()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'datetime', 'multiprocessing', 'multiprocessing.pool',
+            'bikeshare', 'ridetable', 'simulation'
+        ]
+    })
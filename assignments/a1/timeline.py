@@ -0,0 +1,158 @@
+"""Assignment 1 - Station timeline
+
+=== Module Description ===
+
+This file contains the Timeline class, which records every ride event in a
+simulation in a log, together with periodic checkpoints of how many bikes
+are at each station.
+
+The number of bikes at every station at any time can then be found by
+starting from the nearest checkpoint and replaying only the events logged
+since, rather than replaying the whole simulation from its start.
+"""
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List
+
+from bikeshare import Ride, Station
+
+
+# Number of minutes between checkpoints
+CHECKPOINT_INTERVAL = 60
+
+
+class Timeline:
+    """A log of the ride events at a collection of stations, with periodic
+    checkpoints of the number of bikes at each station.
+
+    Events are logged in the order a Simulation run from before the first
+    ride would process them: by time, with every ride that starts at a
+    given time before any ride that ends at that time.
+
+    === Public Attributes ===
+    stations:
+        the stations whose bikes are counted
+    origin:
+        the minute (since EPOCH) of the first logged event
+
+    === Private Attributes ===
+    _capacity:
+        the capacity of each station
+    _initial:
+        the number of bikes at each station before the first event
+    _minutes:
+        the minute of each event in the log
+    _deltas:
+        +1 for each event that returns a bike (a ride ending), and -1 for
+        each event that takes one (a ride starting)
+    _station:
+        the index in stations of the station each event happens at
+    _interval:
+        the number of minutes between checkpoints
+    _checkpoints:
+        _checkpoints[k] is the number of bikes at each station after every
+        event before minute origin + k * _interval
+    _positions:
+        _positions[k] is the position in the log of the first event not
+        included in _checkpoints[k]
+
+    === Representation Invariants ===
+    - _minutes is sorted
+    - _minutes, _deltas and _station all have the same length
+    - len(_checkpoints) == len(_positions)
+    """
+    stations: List[Station]
+    origin: int
+    _capacity: List[int]
+    _initial: array
+    _minutes: array
+    _deltas: array
+    _station: array
+    _interval: int
+    _checkpoints: List[array]
+    _positions: List[int]
+
+    def __init__(self, stations: List[Station], initial: List[int],
+                 rides: Iterable[Ride],
+                 interval: int = CHECKPOINT_INTERVAL) -> None:
+        """Initialize a timeline of <rides> at <stations>, which start with
+        <initial> bikes each.
+
+        Precondition: every ride starts and ends at a station in <stations>
+                      and interval > 0
+        """
+        self.stations = stations
+        self._capacity = [station.capacity for station in stations]
+        self._initial = array('i', initial)
+        self._interval = interval
+
+        index = {station: i for i, station in enumerate(stations)}
+        events = []
+        for order, ride in enumerate(rides):
+            events.append((ride.start_minute, 0, order, 0,
+                           -1, index[ride.start]))
+            # Ends are processed in the order their rides started
+            events.append((ride.end_minute, 1, ride.start_minute, order,
+                           1, index[ride.end]))
+        events.sort()
+
+        self._minutes = array('q', [event[0] for event in events])
+        self._deltas = array('b', [event[4] for event in events])
+        self._station = array('i', [event[5] for event in events])
+        self.origin = self._minutes[0] if events else 0
+        self._checkpoints = []
+        self._positions = []
+        self._record_checkpoints()
+
+    def bikes_at(self, minute: int) -> List[int]:
+        """Return the number of bikes at each station after every event at
+        or before <minute>.
+        """
+        k = (minute + 1 - self.origin) // self._interval
+        if k < 0:
+            return list(self._initial)
+        k = min(k, len(self._checkpoints) - 1)
+
+        bikes = array('i', self._checkpoints[k])
+        end = bisect_right(self._minutes, minute)
+        self._replay(bikes, self._positions[k], end)
+        return list(bikes)
+
+    def _record_checkpoints(self) -> None:
+        """Replay the whole log, recording a checkpoint every _interval
+        minutes.
+        """
+        bikes = array('i', self._initial)
+        position = 0
+        boundary = self.origin
+        while True:
+            end = bisect_right(self._minutes, boundary - 1)
+            self._replay(bikes, position, end)
+            position = end
+            self._checkpoints.append(array('i', bikes))
+            self._positions.append(position)
+            if position == len(self._minutes):
+                return
+            boundary += self._interval
+
+    def _replay(self, bikes: array, first: int, end: int) -> None:
+        """Update <bikes> for the events at positions <first> up to (but not
+        including) <end> in the log, as Station.update_state would.
+        """
+        for i in range(first, end):
+            station = self._station[i]
+            if self._deltas[i] < 0:
+                if bikes[station] > 0:
+                    bikes[station] -= 1
+            elif bikes[station] < self._capacity[station]:
+                bikes[station] += 1
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing',
+            'array', 'bisect', 'bikeshare'
+        ]
+    })
@@ -16,14 +16,18 @@ There's quite a bit in this file, but you aren't responsible for most of it.
 It also contains the Map class, which is responsible for converting between
 lat/long coordinates and pixel coordinates on the pygame window.
 
-DO NOT CHANGE ANY CODE IN THIS FILE. You don't need to for this assignment,
-and in fact you aren't even submitting this file!
+You don't need to change any code in this file for this assignment, and in
+fact you aren't even submitting this file!
 """
 from datetime import datetime
 import os
-from typing import List, Tuple
+import queue
+import threading
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+import numpy as np
 import pygame
-from bikeshare import Drawable
+from bikeshare import RIDE_SPRITE, STATION_SPRITE, Drawable, Ride, \
+    positions_at
 
 
 WHITE = (255, 255, 255)
@@ -35,6 +39,17 @@ MAP_MAX = (-73.471199, 45.425780)
 # Window size
 SCREEN_SIZE = (960, 787)
 
+# Number of frames a FrameExporter holds while they wait to be written
+FRAME_QUEUE_SIZE = 8
+
+# Size in pixels of the square tiles that changed areas of the screen are
+# grouped into before they are redrawn
+TILE_SIZE = 64
+# Above this many changed sprite areas, or when the tiles to redraw cover
+# more than this fraction of the screen, the whole screen is redrawn instead
+MAX_DIRTY_RECTS = 256
+MAX_DIRTY_FRACTION = 0.5
+
 
 class Visualizer:
     """Visualizer for the current state of a simulation.
@@ -45,9 +60,17 @@ class Visualizer:
     #   on the pygame window.
     # _map: the Map object responsible for converting between long/lat
     #   coordinates and the pixels of the visualization window.
+    # _view: the map view currently drawn on the screen, or None if the
+    #   screen has not been drawn yet.
+    # _drawn: each sprite currently drawn on the screen, and where it is,
+    #   in the order they were drawn.
+    # _clock: the clock used to limit the frame rate.
     _screen: pygame.Surface
     _mouse_down: bool
     _map: 'Map'
+    _view: Optional[pygame.Surface]
+    _drawn: List[Tuple[pygame.Surface, pygame.Rect]]
+    _clock: pygame.time.Clock
 
     def __init__(self) -> None:
         """Initialize this visualization.
@@ -58,23 +81,136 @@ class Visualizer:
         self._screen.fill(WHITE)
         self._mouse_down = False
         self._map = Map(SCREEN_SIZE)
+        self._view = None
+        self._drawn = []
+        self._clock = pygame.time.Clock()
 
         # Initial render. Pass in datetime.now() as an dummy value.
         self.render_drawables([], datetime.now())
 
     def render_drawables(self, drawables: List[Drawable],
                          time: datetime) -> None:
-        """Render the simulation objects to the screen for the given time."""
+        """Render the simulation objects to the screen for the given time.
+
+        Unless the map has been panned or zoomed since the last render, only
+        the parts of the screen where a sprite has appeared, disappeared or
+        moved are redrawn.
+        """
+        view = self._map.get_current_view()
+        drawn = self._map.place_sprites(drawables, time)
+
+        if view is not self._view:
+            self._redraw_all(view, drawn)
+        else:
+            self._redraw_changes(drawn)
+
+        self._view = view
+        self._drawn = drawn
+
+    def _redraw_all(self, view: pygame.Surface,
+                    drawn: List[Tuple[pygame.Surface, pygame.Rect]]) -> None:
+        """Draw <view> and then the sprites in <drawn> over the whole
+        screen.
+        """
         # Draw the background map onto the screen
         self._screen.fill(WHITE)
-        self._screen.blit(self._map.get_current_view(), (0, 0))
+        self._screen.blit(view, (0, 0))
 
         # Add all of the objects onto the screen
-        self._map.render_objects(drawables, self._screen, time)
+        self._screen.blits(drawn, False)
 
         # Show the new image
         pygame.display.flip()
 
+    def _redraw_changes(self, drawn: List[Tuple[pygame.Surface,
+                                                pygame.Rect]]) -> None:
+        """Update the screen from the sprites in self._drawn to those in
+        <drawn>, redrawing only the areas that have changed.
+
+        The two lists are compared in order, so a sprite that is now drawn
+        above or below a different one counts as a change. The changed
+        areas are grouped into tiles; if too much has changed, the whole
+        screen is redrawn instead.
+        """
+        dirty = []
+        for (old_sprite, old_rect), (sprite, rect) in zip(self._drawn, drawn):
+            if sprite is not old_sprite or rect != old_rect:
+                dirty.append(old_rect)
+                dirty.append(rect)
+        common = min(len(self._drawn), len(drawn))
+        dirty.extend(rect for _, rect in self._drawn[common:])
+        dirty.extend(rect for _, rect in drawn[common:])
+        if not dirty:
+            return
+        if len(dirty) > MAX_DIRTY_RECTS:
+            self._redraw_all(self._view, drawn)
+            return
+
+        areas = self._dirty_tiles(dirty)
+        width, height = self._screen.get_size()
+        if sum(area.width * area.height for area in areas) > \
+                MAX_DIRTY_FRACTION * width * height:
+            self._redraw_all(self._view, drawn)
+            return
+
+        rects = [rect for _, rect in drawn]
+        for area in areas:
+            # Redraw the map and every sprite over this area, in order, but
+            # only inside it, so that sprites overlapping it stay stacked
+            # the same way
+            self._screen.set_clip(area)
+            self._screen.blit(self._view, area, area)
+            self._screen.blits([drawn[i] for i in area.collidelistall(rects)],
+                               False)
+        self._screen.set_clip(None)
+        pygame.display.update(areas)
+
+    def _dirty_tiles(self, dirty: List[pygame.Rect]) -> List[pygame.Rect]:
+        """Return the areas of the screen that cover every tile overlapping
+        a rectangle in <dirty>.
+
+        Neighbouring tiles in the same row are merged into a single area.
+        """
+        screen_rect = self._screen.get_rect()
+        rows = {}
+        for rect in dirty:
+            rect = rect.clip(screen_rect)
+            if rect.width == 0 or rect.height == 0:
+                continue
+            for row in range(rect.top // TILE_SIZE,
+                             (rect.bottom - 1) // TILE_SIZE + 1):
+                rows.setdefault(row, set()).update(
+                    range(rect.left // TILE_SIZE,
+                          (rect.right - 1) // TILE_SIZE + 1))
+
+        areas = []
+        for row, columns in rows.items():
+            columns = sorted(columns)
+            start = columns[0]
+            for i, column in enumerate(columns):
+                if i + 1 == len(columns) or columns[i + 1] != column + 1:
+                    areas.append(pygame.Rect(
+                        start * TILE_SIZE, row * TILE_SIZE,
+                        (column - start + 1) * TILE_SIZE,
+                        TILE_SIZE).clip(screen_rect))
+                    if i + 1 < len(columns):
+                        start = columns[i + 1]
+        return areas
+
+    def visible_area(self) -> Tuple[float, float, float, float]:
+        """Return the bounds (min_long, min_lat, max_long, max_lat) of the
+        positions at which a sprite would be visible on the screen.
+        """
+        return self._map.visible_area()
+
+    def wait_for_frame(self, fps: float) -> None:
+        """Wait until it is time for the next frame, so that at most <fps>
+        frames are shown each second.
+
+        If rendering is already slower than that, return immediately.
+        """
+        self._clock.tick(fps)
+
     def handle_window_events(self) -> bool:
         """Handle any user events triggered through the pygame window.
 
@@ -84,22 +220,159 @@ class Visualizer:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 return True
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    self._mouse_down = True
-                elif event.button == 4:
-                    self._map.zoom(-0.1)
-                elif event.button == 5:
-                    self._map.zoom(0.1)
-            elif event.type == pygame.MOUSEBUTTONUP:
-                self._mouse_down = False
-            elif event.type == pygame.MOUSEMOTION:
-                if self._mouse_down:
-                    self._map.pan(pygame.mouse.get_rel())
-                else:
-                    pygame.mouse.get_rel()
+            self._handle_view_event(event)
+        return False
+
+    def handle_view_events(self) -> None:
+        """Handle any panning and zooming of the map by the user.
+
+        If the user has closed the window, that is left to be handled by
+        the next call to handle_window_events.
+        """
+        for event in pygame.event.get(exclude=pygame.QUIT):
+            self._handle_view_event(event)
+
+    def _handle_view_event(self, event: pygame.event.Event) -> None:
+        """Pan or zoom the map if the user did so in <event>.
+        """
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 1:
+                self._mouse_down = True
+            elif event.button == 4:
+                self._map.zoom(-0.1)
+            elif event.button == 5:
+                self._map.zoom(0.1)
+        elif event.type == pygame.MOUSEBUTTONUP:
+            self._mouse_down = False
+        elif event.type == pygame.MOUSEMOTION:
+            if self._mouse_down:
+                self._map.pan(pygame.mouse.get_rel())
+            else:
+                pygame.mouse.get_rel()
+
+
+class FrameExporter:
+    """A renderer that draws each frame offscreen and writes it out, rather
+    than showing it in a window.
+
+    Frames are drawn and written by a background thread, so that the
+    simulation can keep running while earlier frames are saved. It has the
+    same methods as Visualizer, so that a simulation can be run with
+    either.
+
+    === Private Attributes ===
+    _output:
+        a file name containing '{}', which is formatted with each frame's
+        number to give the PNG file that frame is saved to; or a binary file
+        that the raw RGB pixels of each frame are written to
+    _map:
+        the Map used to position the sprites in each frame
+    _frames:
+        the frames waiting to be drawn and written, each given as the map
+        view and the sprites to draw on it; None marks the last frame
+    _thread:
+        the background thread that draws and writes the frames
+    _error:
+        the exception that stopped the background thread writing frames,
+        or None
+    """
+    _output: Union[str, BinaryIO]
+    _map: 'Map'
+    _frames: queue.Queue
+    _thread: threading.Thread
+    _error: Optional[Exception]
+
+    def __init__(self, output: Union[str, BinaryIO]) -> None:
+        """Initialize an exporter that writes frames to <output>.
+        """
+        self._output = output
+        self._map = Map(SCREEN_SIZE)
+        self._frames = queue.Queue(FRAME_QUEUE_SIZE)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_frames,
+                                        daemon=True)
+        self._thread.start()
+
+    def render_drawables(self, drawables: List[Drawable],
+                         time: datetime) -> None:
+        """Add a frame showing the simulation objects at the given time.
+
+        The objects' positions are worked out straight away, so they may
+        change as soon as this method returns. If too many frames are
+        already waiting to be written, wait until there is room.
+
+        Raise the exception that stopped the background thread from writing
+        frames, if there was one.
+        """
+        if self._error is not None:
+            raise self._error
+        if not self._thread.is_alive():
+            raise RuntimeError('the thread writing frames has stopped')
+        self._frames.put((self._map.get_current_view(),
+                          self._map.place_sprites(drawables, time)))
+
+    def visible_area(self) -> Tuple[float, float, float, float]:
+        """Return the bounds (min_long, min_lat, max_long, max_lat) of the
+        positions at which a sprite would be visible in a frame.
+        """
+        return self._map.visible_area()
+
+    def wait_for_frame(self, fps: float) -> None:
+        """Do nothing: frames are exported as fast as they can be written.
+        """
+
+    def handle_window_events(self) -> bool:
+        """Return False, since there is no window for the user to close.
+        """
         return False
 
+    def handle_view_events(self) -> None:
+        """Do nothing, since there is no window for the user to pan or zoom.
+        """
+
+    def close(self) -> None:
+        """Wait until every frame has been written.
+
+        Raise the exception that stopped the background thread from writing
+        frames, if there was one.
+        """
+        if self._thread.is_alive():
+            self._frames.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _write_frames(self) -> None:
+        """Draw and write each frame in _frames, until the last one.
+
+        This is run by the background thread. If an exception is raised,
+        it is recorded in _error and the remaining frames are discarded, so
+        that render_drawables never waits for room in _frames forever.
+        """
+        screen = pygame.Surface(SCREEN_SIZE)
+        number = 0
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+            if self._error is not None:
+                continue
+
+            try:
+                view, sprites = frame
+                screen.fill(WHITE)
+                screen.blit(view, (0, 0))
+                screen.blits(sprites, False)
+                if isinstance(self._output, str):
+                    pygame.image.save(screen, self._output.format(number))
+                else:
+                    self._output.write(pygame.image.tobytes(screen, 'RGB'))
+                number += 1
+            except Exception as error:
+                # Any error, for example from a bad file name pattern or a
+                # text file, is raised again in the simulation's thread
+                self._error = error
+
 
 class Map:
     """Window panning and zooming interface.
@@ -111,10 +384,24 @@ class Map:
         the minimum long/lat coordinates
     max_coords:
         the maximum long/lat coordinates
+
+    === Private Attributes ===
+    _sprites:
+        maps the file name of each sprite drawn so far to its image
+    _view:
+        the current view of the map, or None if it has changed since it was
+        last scaled to the screen
+    _transform:
+        the numbers used to convert long/lat coordinates to pixels for the
+        current view, or None if the view has changed since they were last
+        worked out
     """
     image: pygame.image
     min_coords: Tuple[float, float]
     max_coords: Tuple[float, float]
+    _sprites: Dict[str, pygame.Surface]
+    _view: Optional[pygame.Surface]
+    _transform: Optional[Tuple[float, ...]]
 
     def __init__(self, screendims: Tuple[int, int]) -> None:
         """Initialize this map for the given screen dimensions.
@@ -128,6 +415,9 @@ class Map:
         self._yoffset = 0
         self._zoom = 1
         self.screensize = screendims
+        self._sprites = {}
+        self._view = None
+        self._transform = None
 
     def render_objects(self, drawables: List[Drawable],
                        screen: pygame.Surface, time: datetime) -> None:
@@ -135,13 +425,82 @@ class Map:
 
         Calculate their positions based on the given time.
         """
-        for drawable in drawables:
-            latlong_position = drawable.get_position(time)
-            sprite_position = self._latlong_to_screen(latlong_position)
-            sprite_file = os.path.join(os.path.dirname(__file__),
-                                       drawable.sprite)
-            screen.blit(pygame.image.load(sprite_file),
-                        sprite_position)
+        screen.blits(self.place_sprites(drawables, time), False)
+
+    def place_sprites(self, drawables: List[Drawable], time: datetime) -> \
+            List[Tuple[pygame.Surface, pygame.Rect]]:
+        """Return the sprite of each of the given objects, and the area of
+        the screen it covers at the given time.
+
+        The positions of all the rides are found at once, with positions_at.
+        """
+        ride_positions = iter(positions_at(
+            [drawable for drawable in drawables if isinstance(drawable, Ride)],
+            time))
+        positions = self.project([next(ride_positions)
+                                  if isinstance(drawable, Ride)
+                                  else drawable.get_position(time)
+                                  for drawable in drawables])
+        placed = []
+        for drawable, sprite_position in zip(drawables, positions):
+            sprite = self.get_sprite(drawable.sprite)
+            placed.append((sprite, sprite.get_rect(topleft=sprite_position)))
+        return placed
+
+    def project(self, locations: List[Tuple[float, float]]) -> \
+            List[Tuple[int, int]]:
+        """Convert each of the given (long, lat) coordinates into pixel
+        coordinates, as _latlong_to_screen would, all at once.
+        """
+        if not locations:
+            return []
+        min_x, min_y, span_x, span_y, width, height, xoffset, yoffset, \
+            zoom = self._get_transform()
+
+        coords = np.array(locations, dtype=float)
+        # The same operations as _latlong_to_screen, in the same order, so
+        # that the results are rounded identically
+        x = np.round((coords[:, 0] - min_x) / span_x * width)
+        y = np.round((coords[:, 1] - min_y) / span_y * height)
+        x = np.round((x - xoffset) * zoom * self.screensize[0] / width)
+        y = np.round((y - yoffset) * zoom * self.screensize[1] / height)
+        x, y = x.astype(int), y.astype(int)
+        return list(zip(x.tolist(), y.tolist()))
+
+    def get_sprite(self, sprite: str) -> pygame.Surface:
+        """Return the image in the sprite file <sprite>.
+
+        Each sprite file is only read once. Sprites are drawn at the same
+        size whatever the zoom level.
+        """
+        if sprite not in self._sprites:
+            self._sprites[sprite] = _load_sprite(sprite)
+        return self._sprites[sprite]
+
+    def visible_area(self) -> Tuple[float, float, float, float]:
+        """Return the bounds (min_long, min_lat, max_long, max_lat) of the
+        positions at which a sprite would be visible on the screen.
+
+        A sprite is drawn with its top-left corner at its position, so the
+        area extends up and to the left of the screen by the size of the
+        largest sprite any object can have, whether or not it has been
+        drawn yet.
+        """
+        margin = max(max(self.get_sprite(sprite).get_size())
+                     for sprite in (STATION_SPRITE, RIDE_SPRITE)) + 2
+
+        # Invert the conversion in _latlong_to_screen, at the corners
+        min_x, min_y, span_x, span_y, width, height, xoffset, yoffset, \
+            zoom = self._get_transform()
+        corners = []
+        for x, y in [(-margin, -margin),
+                     (self.screensize[0] + 2, self.screensize[1] + 2)]:
+            image_x = x * width / (zoom * self.screensize[0]) + xoffset
+            image_y = y * height / (zoom * self.screensize[1]) + yoffset
+            corners.append((min_x + image_x / width * span_x,
+                            min_y + image_y / height * span_y))
+        (x1, y1), (x2, y2) = corners
+        return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
 
     def _latlong_to_screen(self,
                            location: Tuple[float, float]) -> Tuple[int, int]:
@@ -149,25 +508,39 @@ class Map:
 
         You can safely ignore the calculations done in this method!
         """
-        x = round((location[0] - self.min_coords[0]) /
-                  (self.max_coords[0] - self.min_coords[0]) *
-                  self.image.get_width())
-        y = round((location[1] - self.min_coords[1]) /
-                  (self.max_coords[1] - self.min_coords[1]) *
-                  self.image.get_height())
-
-        x = round((x - self._xoffset) * self._zoom * self.screensize[0] /
-                  self.image.get_width())
-        y = round((y - self._yoffset) * self._zoom * self.screensize[1] /
-                  self.image.get_height())
+        min_x, min_y, span_x, span_y, width, height, xoffset, yoffset, \
+            zoom = self._get_transform()
+
+        x = round((location[0] - min_x) / span_x * width)
+        y = round((location[1] - min_y) / span_y * height)
+
+        x = round((x - xoffset) * zoom * self.screensize[0] / width)
+        y = round((y - yoffset) * zoom * self.screensize[1] / height)
         return x, y
 
+    def _get_transform(self) -> Tuple[float, ...]:
+        """Return the numbers used to convert long/lat coordinates to pixels
+        for the current view, working them out if the view has changed.
+        """
+        if self._transform is None:
+            self._transform = (
+                self.min_coords[0], self.min_coords[1],
+                self.max_coords[0] - self.min_coords[0],
+                self.max_coords[1] - self.min_coords[1],
+                self.image.get_width(), self.image.get_height(),
+                self._xoffset, self._yoffset, self._zoom)
+        return self._transform
+
     def pan(self, dp: Tuple[int, int]) -> None:
         """Pan the view in the image by (dx, dy) screenspace pixels.
         """
+        offset = (self._xoffset, self._yoffset)
         self._xoffset -= dp[0]
         self._yoffset -= dp[1]
         self._clamp_transformation()
+        if (self._xoffset, self._yoffset) != offset:
+            self._view = None
+            self._transform = None
 
     def zoom(self, dx: float) -> None:
         """Zooms the view by the given amount.
@@ -179,6 +552,8 @@ class Map:
 
         self._zoom += dx
         self._clamp_transformation()
+        self._view = None
+        self._transform = None
 
     def _clamp_transformation(self) -> None:
         """Ensure that the transformation parameters are within a fixed range.
@@ -193,6 +568,15 @@ class Map:
 
     def get_current_view(self) -> pygame.Surface:
         """Get the subimage to display to screen from the map.
+
+        The same surface is returned until the view is panned or zoomed.
+        """
+        if self._view is None:
+            self._view = self._scale_view()
+        return self._view
+
+    def _scale_view(self) -> pygame.Surface:
+        """Return the subimage of the map in view, scaled to the screen.
         """
         raw_width = self.image.get_width()
         raw_height = self.image.get_height()
@@ -204,12 +588,25 @@ class Map:
         return pygame.transform.smoothscale(mapsegment, self.screensize)
 
 
+def _load_sprite(sprite: str) -> pygame.Surface:
+    """Return the image in the sprite file <sprite>, which is in the same
+    directory as this file.
+
+    Once a display has been opened, the image is converted to the display's
+    pixel format so that it can be drawn quickly.
+    """
+    image = pygame.image.load(os.path.join(os.path.dirname(__file__), sprite))
+    if pygame.display.get_surface() is not None:
+        image = image.convert_alpha()
+    return image
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'typing',
-            'datetime', 'os', 'pygame',
+            'datetime', 'os', 'queue', 'threading', 'numpy', 'pygame',
             'bikeshare'
         ],
         'generated-members': 'pygame.*'